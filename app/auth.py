@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import jwt
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+
+from app import models
+
+SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "09d25e094faa****************f7099f6f0f4caa6cf63b88e8d3e7")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE = timedelta(minutes=int(os.environ.get("ACCESS_TOKEN_MINUTES", "15")))
+REFRESH_TOKEN_EXPIRE = timedelta(days=int(os.environ.get("REFRESH_TOKEN_DAYS", "7")))
+REFRESH = "refresh"
+CLAIMS_CACHE_SIZE = int(os.environ.get("AUTH_CLAIMS_CACHE_SIZE", "4096"))
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+
+class ClaimsCache:
+    """Bounded LRU of verified token -> claims.
+
+    A token's signature is checked once; later requests with the same token
+    are a dict lookup until the entry reaches the token's ``exp``.
+    """
+
+    def __init__(self, maxsize=CLAIMS_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires, claims = entry
+            if expires <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return claims
+
+    def put(self, token, claims):
+        with self._lock:
+            self._entries[token] = (claims["exp"], claims)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RevocationList:
+    """Revoked refresh-token ids held in memory as 16-byte keys.
+
+    A fast path in front of refresh_tokens.revoked: a replayed or logged-out
+    token is refused without touching the database. An id is only needed
+    until its token expires, so expired ids are pruned as the list grows.
+    """
+
+    def __init__(self):
+        self._expiry = {}
+        self._prune_at = 1024
+        self._lock = threading.Lock()
+
+    def add(self, jti, exp):
+        with self._lock:
+            self._expiry[uuid.UUID(jti).bytes] = int(exp)
+            if len(self._expiry) >= self._prune_at:
+                now = time.time()
+                self._expiry = {key: exp for key, exp in self._expiry.items() if exp > now}
+                self._prune_at = max(1024, 2 * len(self._expiry))
+
+    def __contains__(self, jti):
+        return uuid.UUID(jti).bytes in self._expiry
+
+
+claims_cache = ClaimsCache()
+revoked_tokens = RevocationList()
+
+
+def _unauthorized(detail):
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def create_access_token(data: dict):
+    to_encode = data.copy()
+    to_encode.update({"exp": datetime.utcnow() + ACCESS_TOKEN_EXPIRE})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def _decode(token):
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp"]})
+    except jwt.ExpiredSignatureError:
+        raise _unauthorized("Token has expired")
+    except jwt.InvalidTokenError:
+        raise _unauthorized("Invalid token")
+
+
+def verify_token(token):
+    claims = claims_cache.get(token)
+    if claims is not None:
+        return claims
+    claims = _decode(token)
+    if claims.get("type") == REFRESH:
+        raise _unauthorized("Invalid token")
+    claims_cache.put(token, claims)
+    return claims
+
+
+async def get_claims(token: str = Depends(oauth2_scheme)):
+    """Dependency: the verified claims of the request's bearer token."""
+    if not token:
+        raise _unauthorized("Not authenticated")
+    return verify_token(token)
+
+
+async def get_role(claims: dict = Depends(get_claims)):
+    """Dependency: the ``Role`` claim of the request's bearer token."""
+    role = claims.get("Role")
+    if not role:
+        raise _unauthorized("Token has no role")
+    return role
+
+
+def _expiry_text(exp):
+    return datetime.utcfromtimestamp(exp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def issue_refresh_token(db, email, role):
+    """Create a refresh token; the row is added to ``db`` for the caller to commit."""
+    jti = uuid.uuid4().hex
+    exp = int(time.time() + REFRESH_TOKEN_EXPIRE.total_seconds())
+    db.add(models.RefreshToken(jti=jti, email=email, role=role, expires_at=_expiry_text(exp), revoked=0))
+    return jwt.encode(
+        {"type": REFRESH, "jti": jti, "email": email, "Role": role, "exp": exp},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+
+
+def _refresh_claims(token):
+    claims = _decode(token)
+    if claims.get("type") != REFRESH or not claims.get("jti"):
+        raise _unauthorized("Invalid refresh token")
+    try:
+        revoked = claims["jti"] in revoked_tokens
+    except ValueError:
+        raise _unauthorized("Invalid refresh token")
+    if revoked:
+        raise _unauthorized("Refresh token has been revoked")
+    return claims
+
+
+def _revoke(db, claims):
+    # Only one caller can flip a token from live to revoked, so a refresh
+    # token can be rotated (or revoked) exactly once.
+    revoked = (
+        db.query(models.RefreshToken)
+        .filter(models.RefreshToken.jti == claims["jti"], models.RefreshToken.revoked == 0)
+        .update({models.RefreshToken.revoked: 1}, synchronize_session=False)
+    )
+    revoked_tokens.add(claims["jti"], claims["exp"])
+    return bool(revoked)
+
+
+def rotate_refresh_token(db, token):
+    """Exchange a refresh token for ``(claims, access_token, refresh_token)``.
+
+    Verifies the signature and the revocation list only; credentials are
+    not looked up. The presented token is revoked and a new one issued in
+    the same transaction.
+    """
+    claims = _refresh_claims(token)
+    if not _revoke(db, claims):
+        db.rollback()
+        raise _unauthorized("Refresh token has been revoked")
+    refresh_token = issue_refresh_token(db, claims["email"], claims["Role"])
+    db.commit()
+    access_token = create_access_token({"Role": claims["Role"], "email": claims["email"]})
+    return claims, access_token, refresh_token
+
+
+def revoke_refresh_token(db, token):
+    claims = _refresh_claims(token)
+    _revoke(db, claims)
+    db.commit()
+
+
+def load_revocations(db):
+    """Drop expired refresh tokens and load the live revoked ids; run at startup."""
+    now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    db.query(models.RefreshToken).filter(models.RefreshToken.expires_at < now).delete(synchronize_session=False)
+    db.commit()
+    rows = db.query(models.RefreshToken.jti, models.RefreshToken.expires_at).filter(models.RefreshToken.revoked == 1)
+    for jti, expires_at in rows:
+        exp = datetime.strptime(expires_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+        revoked_tokens.add(jti, exp)
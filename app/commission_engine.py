@@ -0,0 +1,168 @@
+import numpy as np
+from sqlalchemy import update
+
+from app import models
+
+
+class InvalidCommissionInput(ValueError):
+    pass
+
+
+def final_amounts(pay_fee, rate, commission, charges, tds, gst):
+    """Vectorized /select_commission formula, one element per commission.
+
+    The commission on the fee, less charges, is converted at ``rate``; TDS
+    (when set) keeps ``tds``% of it, and GST (when set) is taken off that.
+    """
+    amount = np.round(pay_fee)
+    com_amount = amount * (commission / 100)
+    after_charge = np.where(charges > 0, com_amount - charges, com_amount) * rate
+    after_tds = np.where(tds > 0, (tds / 100) * after_charge, after_charge)
+    after_gst = np.where(gst > 0, after_tds - (gst / 100) * after_tds, 0)
+    return np.where(
+        after_tds != after_charge,
+        after_charge - after_tds - after_gst,
+        after_charge - after_gst,
+    )
+
+
+def _floats(values):
+    try:
+        return np.array([float(v) for v in values], dtype=float)
+    except (TypeError, ValueError):
+        raise InvalidCommissionInput("Incorrect input")
+
+
+def _rates(values):
+    # An empty or zero rate means "not converted yet" and counts as 1.
+    return _floats([v if v else 1 for v in values])
+
+
+def select_commissions(db, data, action):
+    """Totals for the selected commissions, recomputing them when ``action``.
+
+    Every input is validated before anything is written; the recomputed
+    rows are then saved with one bulk UPDATE in a single transaction.
+    """
+    ids = [each_data["id"] for each_data in data]
+    db_rows = {row.id: row for row in db.query(models.commission).filter(models.commission.id.in_(ids))}
+    entries = [(each_data, db_rows[each_data["id"]]) for each_data in data if each_data["id"] in db_rows]
+
+    paid = np.array([bool(row.pay_recieve) for _, row in entries], dtype=bool)
+    final = np.array([row.final_amount or 0 for _, row in entries], dtype=float)
+
+    if action:
+        gst = _floats(each_data["gst"] for each_data, _ in entries)
+        tds = _floats(each_data["tds"] for each_data, _ in entries)
+        com = _floats(each_data["commission"] for each_data, _ in entries)
+        charges = _floats(each_data["charges"] for each_data, _ in entries)
+        rate = _rates(each_data["rate"] for each_data, _ in entries)
+        pay_fee = _floats(row.pay_fee for _, row in entries)
+        if ((np.minimum.reduce([tds, gst, com, charges]) < 0) & ~paid).any():
+            raise InvalidCommissionInput("Incorrect input")
+
+        final = np.where(paid, final, final_amounts(pay_fee, rate, com, charges, tds, gst))
+        updates = []
+        for i, (each_data, row) in enumerate(entries):
+            values = {
+                "id": row.id,
+                "charges": each_data["charges"],
+                "gain_commission": each_data["commission"],
+                "tds": each_data["tds"],
+                "gst": each_data["gst"],
+                "rate": each_data["rate"],
+            }
+            if not paid[i]:
+                values["final_amount"] = round(float(final[i]), 3)
+            updates.append(values)
+        if updates:
+            db.execute(update(models.commission), updates)
+            db.commit()
+    else:
+        com = _floats((row.gain_commission if paid[i] else 0) for i, (_, row) in enumerate(entries))
+
+    return {
+        "total": round(float(final.sum()), 3),
+        "profit": round(float(((com / 100) * final)[paid].sum()), 3),
+        "pending": round(float(final[~paid].sum()), 3),
+        "recieved": round(float(final[paid].sum()), 3),
+    }
+
+
+def _stored(values):
+    # Stored figures are free-form strings; anything unparseable counts as 0.
+    out = np.zeros(len(values), dtype=float)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+def simulate(db, rate=None, rates=None, tds=None, gst=None):
+    """What-if totals for every pending commission under a new scenario.
+
+    Nothing is written. ``rate``, ``tds`` and ``gst`` replace the stored
+    values when given, and ``rates`` maps currencies to their own rate.
+    """
+    for value in [rate, tds, gst, *(rates or {}).values()]:
+        if value is not None and value < 0:
+            raise InvalidCommissionInput("Incorrect input")
+
+    rows = (
+        db.query(
+            models.commission.agent_id,
+            models.commission.agent,
+            models.commission.currency,
+            models.commission.pay_fee,
+            models.commission.charges,
+            models.commission.tds,
+            models.commission.gst,
+            models.commission.rate,
+            models.commission.gain_commission,
+            models.commission.final_amount,
+        )
+        .filter(models.commission.pay_recieve == 0)
+        .all()
+    )
+    agent_id, agent, currency, pay_fee, charges, row_tds, row_gst, row_rate, com, current = (
+        list(zip(*rows)) or [()] * 10
+    )
+
+    pay_fee, charges, com, current = _stored(pay_fee), _stored(charges), _stored(com), _stored(current)
+    row_tds = np.full(len(rows), tds, dtype=float) if tds is not None else _stored(row_tds)
+    row_gst = np.full(len(rows), gst, dtype=float) if gst is not None else _stored(row_gst)
+    row_rate = np.full(len(rows), rate, dtype=float) if rate is not None else _stored(row_rate)
+    currency = np.array([(curr or "").upper() for curr in currency], dtype=str)
+    for curr, curr_rate in (rates or {}).items():
+        row_rate[currency == curr.upper()] = curr_rate
+    # A zero rate means the commission has not been converted yet.
+    row_rate = np.where(row_rate > 0, row_rate, 1)
+
+    simulated = np.round(final_amounts(pay_fee, row_rate, com, charges, row_tds, row_gst), 3)
+
+    keys, group = np.unique(
+        np.array([-1 if a is None else a for a in agent_id], dtype=np.int64), return_inverse=True
+    )
+    names = dict(zip(group.tolist(), agent))
+    counts = np.bincount(group, minlength=len(keys))
+    current_by_agent = np.bincount(group, weights=current, minlength=len(keys))
+    simulated_by_agent = np.bincount(group, weights=simulated, minlength=len(keys))
+
+    def summary(count, before, after):
+        return {
+            "count": int(count),
+            "current": round(float(before), 3),
+            "simulated": round(float(after), 3),
+            "difference": round(float(after - before), 3),
+        }
+
+    return {
+        "agents": [
+            dict(agent_id=None if key == -1 else int(key), agent=names[i],
+                 **summary(counts[i], current_by_agent[i], simulated_by_agent[i]))
+            for i, key in enumerate(keys)
+        ],
+        "total": summary(len(rows), current.sum(), simulated.sum()),
+    }
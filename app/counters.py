@@ -0,0 +1,108 @@
+import sys
+
+from sqlalchemy import func, select
+
+from app import models
+
+# Rollup keys kept in dashboard_counters:
+#   students, agents, applications  - entity totals
+#   status:<label>                  - applications per status
+#   month:<1-12>                    - applications per month of their timestamp
+STUDENTS = "students"
+AGENTS = "agents"
+APPLICATIONS = "applications"
+
+
+def status_key(status):
+    return f"status:{status}"
+
+
+def month_key(timestamp):
+    month = (timestamp or "")[5:7]
+    return f"month:{int(month)}" if month.isdigit() else None
+
+
+def bump(db, key, delta=1):
+    # Runs inside the caller's transaction so the counter moves together
+    # with the row change it describes.
+    if key is None or not delta:
+        return
+    updated = (
+        db.query(models.DashboardCounter)
+        .filter(models.DashboardCounter.key == key)
+        .update({models.DashboardCounter.value: models.DashboardCounter.value + delta},
+                synchronize_session=False)
+    )
+    if not updated:
+        db.add(models.DashboardCounter(key=key, value=delta))
+        db.flush()
+
+
+def application_added(db, status, timestamp, delta=1):
+    bump(db, APPLICATIONS, delta)
+    bump(db, status_key(status), delta)
+    bump(db, month_key(timestamp), delta)
+
+
+def application_removed(db, status, timestamp):
+    application_added(db, status, timestamp, delta=-1)
+
+
+def status_changed(db, old_status, new_status):
+    if old_status != new_status:
+        bump(db, status_key(old_status), -1)
+        bump(db, status_key(new_status), 1)
+
+
+def timestamp_changed(db, old_timestamp, new_timestamp):
+    if month_key(old_timestamp) != month_key(new_timestamp):
+        bump(db, month_key(old_timestamp), -1)
+        bump(db, month_key(new_timestamp), 1)
+
+
+async def snapshot_async(db):
+    result = await db.execute(select(models.DashboardCounter.key, models.DashboardCounter.value))
+    return {key: value for key, value in result}
+
+
+def rebuild(db):
+    """Recompute every counter from the source tables (drift repair)."""
+    counts = {
+        STUDENTS: db.query(func.count(models.User.id)).scalar(),
+        AGENTS: db.query(func.count(models.agent_data.id)).scalar(),
+        APPLICATIONS: 0,
+    }
+    for status, count in (
+        db.query(models.Application.status, func.count(models.Application.id))
+        .group_by(models.Application.status)
+    ):
+        counts[APPLICATIONS] += count
+        counts[status_key(status)] = count
+
+    month = func.substr(models.Application.timestamp, 1, 7)
+    for timestamp, count in db.query(month, func.count(models.Application.id)).group_by(month):
+        key = month_key(timestamp)
+        if key:
+            counts[key] = counts.get(key, 0) + count
+
+    db.query(models.DashboardCounter).delete(synchronize_session=False)
+    db.add_all(models.DashboardCounter(key=key, value=value) for key, value in counts.items())
+    db.commit()
+    return counts
+
+
+def ensure(db):
+    if db.query(models.DashboardCounter.key).first() is None:
+        rebuild(db)
+
+
+if __name__ == "__main__":
+    # python -m app.counters rebuild
+    from app.database import engine, SessionLocal
+
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m app.counters rebuild")
+    models.Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        for key, value in sorted(rebuild(db).items()):
+            print(f"{key}: {value}")
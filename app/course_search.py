@@ -0,0 +1,85 @@
+import re
+
+from sqlalchemy import column, literal, literal_column, or_, table, text
+from sqlalchemy.exc import OperationalError
+
+from app import models
+
+# FTS5 index over course_name.course_name and course_name.uni_name. It is an
+# external-content table, so the triggers below keep it in step with every
+# write to course_name, including imports done outside the API.
+course_search = table("course_search", column("rowid"), column("rank"))
+rank = course_search.c.rank
+
+enabled = False
+
+FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS course_search USING fts5(
+        course_name, uni_name,
+        content='course_name', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS course_search_ai AFTER INSERT ON course_name BEGIN
+        INSERT INTO course_search(rowid, course_name, uni_name)
+        VALUES (new.id, new.course_name, new.uni_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS course_search_ad AFTER DELETE ON course_name BEGIN
+        INSERT INTO course_search(course_search, rowid, course_name, uni_name)
+        VALUES ('delete', old.id, old.course_name, old.uni_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS course_search_au AFTER UPDATE ON course_name BEGIN
+        INSERT INTO course_search(course_search, rowid, course_name, uni_name)
+        VALUES ('delete', old.id, old.course_name, old.uni_name);
+        INSERT INTO course_search(rowid, course_name, uni_name)
+        VALUES (new.id, new.course_name, new.uni_name);
+    END""",
+]
+
+
+def ensure_index(conn):
+    """Create the FTS table and triggers; returns False when FTS5 is unavailable."""
+    global enabled
+    if conn.dialect.name != "sqlite":
+        return False
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'course_search'")
+    ).first()
+    try:
+        for ddl in FTS_DDL:
+            conn.execute(text(ddl))
+    except OperationalError:
+        return False
+    if not exists:
+        conn.execute(text("INSERT INTO course_search(course_search) VALUES ('rebuild')"))
+    enabled = True
+    return True
+
+
+def match_expression(search):
+    # Every word must match as a prefix: "comp sci" -> "comp"* "sci"*
+    tokens = re.findall(r"\w+", search)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def search(query, global_search):
+    """Narrow a CourseName query to courses matching ``global_search``.
+
+    Returns the query, now yielding ``(CourseName, rank)`` rows, and the
+    keys to paginate it by. With the FTS index results are ordered by
+    relevance; otherwise it falls back to substring matching by id.
+    """
+    expression = match_expression(global_search)
+    if enabled and expression:
+        query = (
+            query.add_columns(rank)
+            .join(course_search, literal_column("course_search.rowid") == models.CourseName.id)
+            .filter(literal_column("course_search").op("MATCH")(expression))
+            .order_by(rank, models.CourseName.id)
+        )
+        return query, (rank, models.CourseName.id)
+
+    query = query.add_columns(literal(0).label("rank")).filter(or_(
+        models.CourseName.course_name.ilike(f"%{global_search}%"),
+        models.CourseName.uni_name.ilike(f"%{global_search}%"),
+    ))
+    return query, (models.CourseName.id,)
@@ -1,18 +1,127 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHAMY_DATABASE_URL = 'sqlite:///./new.db'
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./new.db")
+# Reads can be pointed at a replica; on SQLite they share the file.
+DATABASE_READ_URL = os.environ.get("DATABASE_READ_URL", DATABASE_URL)
+SQLALCHAMY_DATABASE_URL = DATABASE_URL
+
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", "10"))
+
+# Applied to every SQLite connection. WAL lets readers run alongside the
+# single writer, and busy_timeout makes a writer wait for the lock instead
+# of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    "cache_size": os.environ.get("SQLITE_CACHE_SIZE", "-65536"),  # negative = KiB, i.e. 64 MiB
+    "mmap_size": os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "foreign_keys": os.environ.get("SQLITE_FOREIGN_KEYS", "ON"),
+}
+
+
+def _pool_args(url, pool_size):
+    # In-memory SQLite uses a single shared connection, not a sized pool.
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {"pool_size": pool_size}
+
+
+def _apply_pragmas(engine, pragmas, read_only):
+    pragmas = dict(SQLITE_PRAGMAS if pragmas is None else pragmas)
+    if read_only:
+        pragmas["query_only"] = "ON"
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+def make_engine(url=DATABASE_URL, read_only=False, pool_size=POOL_SIZE, pragmas=None):
+    """Create an engine for ``url``.
+
+    SQLite connections get ``SQLITE_PRAGMAS`` (or ``pragmas``) on connect,
+    and ``query_only`` when ``read_only`` so a read session can never write.
+    """
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return create_engine(url, pool_size=pool_size, pool_pre_ping=True)
+
+    engine = create_engine(url, connect_args={"check_same_thread": False}, **_pool_args(url, pool_size))
+    _apply_pragmas(engine, pragmas, read_only)
+    return engine
+
+
+def async_url(url):
+    """``url`` with its async driver: aiosqlite for SQLite, asyncpg for PostgreSQL."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    if backend == "postgresql":
+        return url.set(drivername="postgresql+asyncpg")
+    return url
+
 
-engine = create_engine(SQLALCHAMY_DATABASE_URL, connect_args={"check_same_thread": False})
+def make_async_engine(url=DATABASE_URL, read_only=False, pool_size=POOL_SIZE, pragmas=None):
+    """:func:`make_engine` for AsyncSession, on the matching async driver."""
+    url = async_url(url)
+    if url.get_backend_name() != "sqlite":
+        return create_async_engine(url, pool_size=pool_size, pool_pre_ping=True)
+
+    engine = create_async_engine(url, **_pool_args(url, pool_size))
+    _apply_pragmas(engine.sync_engine, pragmas, read_only)
+    return engine
+
+
+engine = make_engine(DATABASE_URL)
+read_engine = make_engine(DATABASE_READ_URL, read_only=True, pool_size=READ_POOL_SIZE)
 
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False,)
+ReadSessionLocal = sessionmaker(bind=read_engine, autocommit=False, autoflush=False,)
+
+# Async read engine for the read endpoints ported to AsyncSession; queries
+# there await the driver instead of blocking the event loop.
+async_read_engine = make_async_engine(DATABASE_READ_URL, read_only=True, pool_size=READ_POOL_SIZE)
+AsyncReadSessionLocal = async_sessionmaker(bind=async_read_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
+
+def upsert(db, model):
+    """An ``INSERT`` on ``model`` with ``on_conflict_do_nothing``/``_do_update``
+    for the session's dialect (PostgreSQL or SQLite)."""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def get_read_db():
+    # For endpoints that only read; served from the read engine's pool.
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
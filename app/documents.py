@@ -0,0 +1,170 @@
+import mimetypes
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+from app import models, uploads
+from app.database import upsert
+
+# Content-addressed document store: every distinct file is kept once, at
+# <STORE_DIR>/<first two hex digits>/<sha256>, and rows refer to it by hash.
+# document_blobs.ref_count tracks how many row columns point at a blob; gc()
+# recounts them from the rows and removes blobs nothing refers to.
+STORE_DIR = Path(os.environ.get("DOCUMENT_STORE_DIR", "uploaded_files/blobs"))
+TEMP_DIR = STORE_DIR / "tmp"
+GC_GRACE_HOURS = int(os.environ.get("DOCUMENT_GC_GRACE_HOURS", "1"))
+
+AGENCY_DOCUMENTS = ["cancel_check", "pan_card", "company_registration", "aadhar_card", "gst_certificate"]
+
+
+def blob_path(sha256):
+    return STORE_DIR / sha256[:2] / sha256
+
+
+def _now():
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def content_type(filename, fallback=None):
+    guessed, _ = mimetypes.guess_type(filename or "")
+    return guessed or fallback or "application/octet-stream"
+
+
+def _keep(staged):
+    # An identical blob is already stored: drop the staged copy and just
+    # refresh the blob's mtime so a concurrent gc() leaves it alone.
+    path = blob_path(staged.sha256)
+    if path.exists():
+        os.utime(path)
+        Path(staged.temp).unlink(missing_ok=True)
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    uploads.publish(staged.temp, path)
+    return True
+
+
+def _register(db, sha256, size, mime):
+    # One statement in the caller's transaction: a new blob row starts with
+    # this upload's reference, an existing one gains it.
+    now = _now()
+    db.execute(
+        upsert(db, models.DocumentBlob)
+        .values(sha256=sha256, size=size, content_type=mime, ref_count=1, touched_at=now)
+        .on_conflict_do_update(
+            index_elements=["sha256"],
+            set_={"ref_count": models.DocumentBlob.ref_count + 1, "touched_at": now},
+        )
+    )
+
+
+async def store_all(db, files):
+    """Store ``{key: UploadFile}`` and return ``{key: sha256}``.
+
+    Uploads are staged concurrently; content that is already in the store
+    is not written again. Each stored file takes a reference on its blob row
+    in ``db``; the caller hands it to a record with :func:`attach` and
+    commits.
+    """
+    TEMP_DIR.mkdir(parents=True, exist_ok=True)
+    staged = await uploads.stage_all({key: (file, TEMP_DIR / key) for key, file in files.items()})
+    try:
+        for key, staged_file in staged.items():
+            await run_in_threadpool(_keep, staged_file)
+            _register(db, staged_file.sha256, staged_file.size,
+                      content_type(files[key].filename, files[key].content_type))
+    except BaseException:
+        await uploads.discard_all(staged.values())
+        raise
+    return {key: staged_file.sha256 for key, staged_file in staged.items()}
+
+
+def _release(db, sha256):
+    if sha256 is None:
+        return
+    db.query(models.DocumentBlob).filter(
+        models.DocumentBlob.sha256 == sha256, models.DocumentBlob.ref_count > 0
+    ).update(
+        {models.DocumentBlob.ref_count: models.DocumentBlob.ref_count - 1},
+        synchronize_session=False,
+    )
+
+
+def attach(db, record, hashes):
+    """Point ``record``'s document columns at ``hashes`` from :func:`store_all`.
+
+    The references taken by :func:`store_all` pass to ``record``; the ones
+    it held on the blobs it replaces are released.
+    """
+    for document, sha256 in hashes.items():
+        _release(db, getattr(record, f"{document}_sha256"))
+        setattr(record, f"{document}_sha256", sha256)
+        setattr(record, f"{document}_path", str(blob_path(sha256)))
+
+
+def reference_counts(db):
+    counts = Counter()
+    columns = [getattr(models.AgencyFiles, f"{document}_sha256") for document in AGENCY_DOCUMENTS]
+    for row in db.query(*columns):
+        counts.update(sha256 for sha256 in row if sha256)
+    return counts
+
+
+def gc(db, grace_hours=GC_GRACE_HOURS):
+    """Mark-and-sweep unreferenced blobs.
+
+    Ref counts are recomputed from the rows (repairing any drift), then
+    blobs with no references, stray files with no blob row and leftover
+    temp files are deleted once they are older than the grace period, so
+    uploads still in flight are never swept.
+    """
+    counts = reference_counts(db)
+    cutoff = datetime.utcnow() - timedelta(hours=grace_hours)
+    cutoff_text = cutoff.strftime('%Y-%m-%d %H:%M:%S')
+    cutoff_mtime = time.time() - grace_hours * 3600
+
+    removed, freed = 0, 0
+    known = set()
+    for blob in db.query(models.DocumentBlob):
+        blob.ref_count = counts.get(blob.sha256, 0)
+        path = blob_path(blob.sha256)
+        stale = (blob.touched_at or "") < cutoff_text and (
+            not path.exists() or path.stat().st_mtime < cutoff_mtime
+        )
+        if blob.ref_count or not stale:
+            known.add(blob.sha256)
+            continue
+        if path.exists():
+            freed += path.stat().st_size
+            path.unlink()
+        db.delete(blob)
+        removed += 1
+    db.commit()
+
+    # Files with no blob row: uploads whose transaction never committed and
+    # abandoned temp files.
+    if STORE_DIR.exists():
+        for path in STORE_DIR.glob("*/*"):
+            if path.name in known or not path.is_file():
+                continue
+            if path.stat().st_mtime < cutoff_mtime:
+                freed += path.stat().st_size
+                path.unlink()
+                removed += 1
+    return {"removed": removed, "freed_bytes": freed}
+
+
+if __name__ == "__main__":
+    # python -m app.documents gc
+    from app.database import engine, SessionLocal
+
+    if sys.argv[1:] != ["gc"]:
+        sys.exit("usage: python -m app.documents gc")
+    models.Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        result = gc(db)
+    print(f"removed {result['removed']} blobs, freed {result['freed_bytes']} bytes")
@@ -0,0 +1,112 @@
+import os
+
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app import documents
+
+CHUNK_SIZE = 64 * 1024
+
+# A blob URL names its content, so browsers may keep it forever; a
+# document URL can be pointed at a new blob and must be revalidated
+# (cheaply, via If-None-Match and the content-hash ETag).
+IMMUTABLE = "private, max-age=31536000, immutable"
+REVALIDATE = "private, max-age=0, must-revalidate"
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """``(start, end)`` for a single ``bytes=`` range, inclusive.
+
+    Returns None for anything that should be answered with the whole file
+    (other units, multiple ranges, malformed specs) and raises
+    RangeNotSatisfiable when the range starts past the end, which every
+    range of an empty file does.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0 or size == 0:
+                raise RangeNotSatisfiable
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    if end < start:
+        return None
+    return start, end
+
+
+def etag_matches(header, etag):
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+async def _read_range(path, start, end):
+    file = await run_in_threadpool(open, path, "rb")
+    try:
+        await run_in_threadpool(file.seek, start)
+        remaining = end - start + 1
+        while remaining:
+            chunk = await run_in_threadpool(file.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+async def serve(request, blob, cache_control, filename=None):
+    """Respond with a stored blob.
+
+    The ETag is the content hash, so If-None-Match gives a 304 without
+    touching the file. A single byte range gets a 206; everything else is a
+    FileResponse, which the server can send without copying through Python.
+    """
+    path = documents.blob_path(blob.sha256)
+    try:
+        stat_result = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Document not found.")
+
+    etag = f'"{blob.sha256}"'
+    media_type = blob.content_type or documents.content_type(filename)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if filename:
+        headers["Content-Disposition"] = f'inline; filename="{filename}"'
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        size = stat_result.st_size
+        try:
+            span = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if span:
+            start, end = span
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _read_range(path, start, end), status_code=206, media_type=media_type, headers=headers
+            )
+
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
@@ -0,0 +1,193 @@
+import importlib.util
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import func, text
+from sqlalchemy.exc import OperationalError
+
+from app import exports, models
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = Path(os.environ.get("EXPORT_DIR", "exports"))
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", "1"))
+EXPORT_RETENTION_HOURS = int(os.environ.get("EXPORT_RETENTION_HOURS", "24"))
+PROGRESS_EVERY = exports.BATCH_SIZE
+
+FORMATS = {
+    "xlsx": exports.XLSX_MEDIA_TYPE,
+    "csv": exports.CSV_MEDIA_TYPE,
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_executor = None
+
+
+def _pool():
+    # Jobs run in separate worker processes so a long export never holds
+    # an API worker; "spawn" keeps the parent's engine out of the child.
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def format_supported(fmt):
+    if fmt == "parquet":
+        return importlib.util.find_spec("pyarrow") is not None
+    return fmt in FORMATS
+
+
+def enqueue(db, fmt, agent_ids, app_ids):
+    cleanup(db)
+    job = models.ExportJob(
+        id=uuid.uuid4().hex,
+        status="queued",
+        format=fmt,
+        params={"agent_ids": agent_ids, "app_ids": app_ids},
+        rows_written=0,
+        created_at=_now(),
+    )
+    db.add(job)
+    db.commit()
+    _pool().submit(run_job, job.id)
+    return job
+
+
+def run_job(job_id):
+    with SessionLocal() as db:
+        job = db.query(models.ExportJob).filter(models.ExportJob.id == job_id).first()
+        if job is None:
+            return
+        agent_ids = job.params.get("agent_ids") or []
+        app_ids = job.params.get("app_ids") or []
+        fmt = job.format
+
+        EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+        path, partial = _paths(job_id, fmt)
+        job.status = "running"
+        job.total_rows = exports.count_rows(db, agent_ids, app_ids)
+        db.commit()
+
+        written = 0
+        live_progress = True
+
+        def progress():
+            nonlocal written, live_progress
+            written += 1
+            if live_progress and written % PROGRESS_EVERY == 0:
+                live_progress = _record_progress(job_id, written)
+
+        try:
+            # The export reads through its own session and progress is
+            # written through short sessions of its own, so no write ever
+            # runs inside the export's read transaction.
+            with SessionLocal() as reader:
+                live_progress = _wal(reader)
+                sheets = exports.export_sheets(reader, agent_ids, app_ids)
+                if fmt == "csv":
+                    with open(partial, "w", newline="", encoding="utf-8") as out:
+                        exports.write_csv(sheets, out, progress)
+                elif fmt == "parquet":
+                    exports.write_parquet(sheets, partial, progress)
+                else:
+                    with open(partial, "wb") as out:
+                        exports.write_xlsx(sheets, out, progress)
+            os.replace(partial, path)
+        except Exception as e:
+            logger.error(f"Export job {job_id} failed: {e}")
+            partial.unlink(missing_ok=True)
+            db.rollback()
+            job.status = "failed"
+            job.error = str(e)
+        else:
+            job.status = "done"
+            job.file_path = str(path)
+        job.rows_written = written
+        job.finished_at = _now()
+        db.commit()
+
+
+def _wal(db):
+    # Progress is only written while the export reads when the database
+    # lets a writer in alongside an open reader: anything but SQLite, or
+    # SQLite in WAL mode (the default, see app.database.SQLITE_PRAGMAS).
+    # In rollback-journal mode the reader's shared lock would make every
+    # progress write wait out busy_timeout; the row count then only
+    # appears when the job finishes.
+    if db.get_bind().dialect.name != "sqlite":
+        return True
+    return db.execute(text("PRAGMA journal_mode")).scalar().lower() == "wal"
+
+
+def _record_progress(job_id, written):
+    try:
+        with SessionLocal() as db:
+            db.query(models.ExportJob).filter(models.ExportJob.id == job_id).update(
+                {models.ExportJob.rows_written: written}, synchronize_session=False
+            )
+            db.commit()
+    except OperationalError as e:
+        logger.warning(f"Export job {job_id}: progress not recorded, continuing without it: {e}")
+        return False
+    return True
+
+
+def cleanup(db):
+    """Delete jobs, and their files, older than the retention window.
+
+    Jobs that never finished expire by their creation time, running ones
+    included: a job still running after the whole window lost its worker
+    (a restart or a killed process), and its ``.part`` file goes with it.
+    """
+    cutoff = (datetime.utcnow() - timedelta(hours=EXPORT_RETENTION_HOURS)).strftime('%Y-%m-%d %H:%M:%S')
+    expired = db.query(models.ExportJob).filter(
+        func.coalesce(models.ExportJob.finished_at, models.ExportJob.created_at) < cutoff
+    ).all()
+    for job in expired:
+        paths = [*_paths(job.id, job.format), *([Path(job.file_path)] if job.file_path else [])]
+        for path in paths:
+            path.unlink(missing_ok=True)
+        db.delete(job)
+    db.commit()
+    return len(expired)
+
+
+def shutdown():
+    # Called when the app stops. Jobs not started yet are dropped (their
+    # rows stay "queued" until cleanup() expires them); the app does not
+    # wait for running ones.
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _paths(job_id, fmt):
+    path = EXPORT_DIR / f"{job_id}.{fmt}"
+    return path, path.with_name(path.name + ".part")
+
+
+def describe(job):
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "format": job.format,
+        "rows_written": job.rows_written,
+        "total_rows": job.total_rows,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def _now():
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,190 @@
+import csv
+import io
+import os
+import tempfile
+
+from openpyxl import Workbook
+
+from app import models
+from app.database import SessionLocal
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_MEDIA_TYPE = "text/csv"
+
+STUDENT_COLUMNS = [
+    ("Name", models.User.name),
+    ("Email", models.User.email),
+    ("Phone", models.User.phone),
+    ("Agent", models.User.agent),
+    ("Address", models.User.address),
+    ("City", models.User.city),
+    ("State", models.User.state),
+    ("Country", models.User.country),
+    ("Passport", models.User.passport),
+]
+
+APPLICATION_COLUMNS = [
+    ("Student Name", models.Application.student_name),
+    ("Country", models.Application.Country),
+    ("University Name", models.Application.university_name),
+    ("Intake", models.Application.intake),
+    ("Program Level", models.Application.program_level),
+    ("Program", models.Application.program),
+    ("Status", models.Application.status),
+    ("Yearly Fee", models.Application.yearly_fee),
+    ("Scholarship", models.Application.scholarship),
+    ("Agent", models.User.agent),
+]
+
+
+def export_sheets(db, agent_ids, app_ids):
+    """Yield ``(sheet_name, headers, rows)`` for every non-empty sheet.
+
+    ``rows`` is a lazy iterator that reads the database ``BATCH_SIZE`` rows
+    at a time, so no sheet is ever fully held in memory.
+    """
+    agents = {
+        agent.id: agent
+        for agent in db.query(models.agent_data).filter(models.agent_data.id.in_(agent_ids))
+    }
+    for agent_id in agent_ids:
+        agent = agents.get(agent_id)
+        if not agent:
+            continue
+        students = (
+            db.query(*(column for _, column in STUDENT_COLUMNS))
+            .filter(models.User.agent.ilike(f'%{agent.name}%'))
+            .order_by(models.User.id)
+            .yield_per(BATCH_SIZE)
+        )
+        yield from _sheet(agent.name.replace(" ", "").lower(), STUDENT_COLUMNS, students)
+
+    if app_ids:
+        applications = (
+            db.query(*(column for _, column in APPLICATION_COLUMNS))
+            .join(models.User, models.Application.student_id == models.User.id)
+            .filter(models.Application.id.in_(app_ids))
+            .order_by(models.Application.id)
+            .yield_per(BATCH_SIZE)
+        )
+        yield from _sheet("Applications", APPLICATION_COLUMNS, applications)
+
+
+def _sheet(name, columns, query):
+    rows = iter(query)
+    first = next(rows, None)
+    if first is None:
+        return
+    yield name[:31], ["Sr No."] + [header for header, _ in columns], _numbered(first, rows)
+
+
+def _numbered(first, rows):
+    yield [1, *first]
+    for number, row in enumerate(rows, start=2):
+        yield [number, *row]
+
+
+def count_rows(db, agent_ids, app_ids):
+    total = 0
+    for (name,) in db.query(models.agent_data.name).filter(models.agent_data.id.in_(agent_ids)):
+        total += db.query(models.User.id).filter(models.User.agent.ilike(f'%{name}%')).count()
+    if app_ids:
+        total += (
+            db.query(models.Application.id)
+            .join(models.User, models.Application.student_id == models.User.id)
+            .filter(models.Application.id.in_(app_ids))
+            .count()
+        )
+    return total
+
+
+def write_xlsx(sheets, out, progress=None):
+    # Write-only mode streams each row to a temp file instead of building
+    # the worksheet in memory.
+    workbook = Workbook(write_only=True)
+    for name, headers, rows in sheets:
+        worksheet = workbook.create_sheet(name)
+        worksheet.append(headers)
+        for row in rows:
+            worksheet.append(row)
+            if progress:
+                progress()
+    if not workbook.worksheets:
+        workbook.create_sheet("Sheet")
+    workbook.save(out)
+
+
+def write_csv(sheets, out, progress=None):
+    writer = csv.writer(out)
+    for name, headers, rows in sheets:
+        writer.writerow([name])
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow(row)
+            if progress:
+                progress()
+        writer.writerow([])
+
+
+def write_parquet(sheets, path, progress=None):
+    # Parquet needs a single schema: every sheet's columns as strings plus
+    # a "Sheet" column, written one record batch at a time.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    headers = ["Sheet", "Sr No."]
+    for columns in (STUDENT_COLUMNS, APPLICATION_COLUMNS):
+        headers += [header for header, _ in columns if header not in headers]
+    schema = pa.schema([(header, pa.string()) for header in headers])
+
+    with pq.ParquetWriter(path, schema) as writer:
+        for name, sheet_headers, rows in sheets:
+            batch = []
+            for row in rows:
+                record = dict(zip(sheet_headers, (None if v is None else str(v) for v in row)))
+                record["Sheet"] = name
+                batch.append(record)
+                if progress:
+                    progress()
+                if len(batch) >= BATCH_SIZE:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    batch = []
+            if batch:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+
+def stream_csv(agent_ids, app_ids):
+    with SessionLocal() as db:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for name, headers, rows in export_sheets(db, agent_ids, app_ids):
+            writer.writerow([name])
+            writer.writerow(headers)
+            for row in rows:
+                writer.writerow(row)
+                if buffer.tell() >= CHUNK_SIZE:
+                    yield buffer.getvalue().encode()
+                    buffer.seek(0)
+                    buffer.truncate()
+            writer.writerow([])
+        yield buffer.getvalue().encode()
+
+
+def xlsx_file(agent_ids, app_ids):
+    """Write the XLSX export to a temporary file and return its path.
+
+    The XLSX container is a zip that is only complete once saved, so unlike
+    the CSV export nothing can be sent before every row is written. The
+    caller removes the file once it has been sent.
+    """
+    file = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False)
+    try:
+        with SessionLocal() as db, file:
+            write_xlsx(export_sheets(db, agent_ids, app_ids), file)
+    except BaseException:
+        os.unlink(file.name)
+        raise
+    return file.name
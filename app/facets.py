@@ -0,0 +1,87 @@
+from sqlalchemy import func, text
+
+from app import models
+
+# course_name writes bump catalog_versions through these triggers, so the
+# cached facets are invalidated by any writer, not only this process.
+VERSION_DDL = [
+    "INSERT OR IGNORE INTO catalog_versions (name, version) VALUES ('course_name', 0)",
+] + [
+    f"""CREATE TRIGGER IF NOT EXISTS course_name_version_{suffix} AFTER {event} ON course_name BEGIN
+        UPDATE catalog_versions SET version = version + 1 WHERE name = 'course_name';
+    END"""
+    for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE"))
+]
+
+_cache = {}
+
+
+def ensure_version_triggers(conn):
+    if conn.dialect.name != "sqlite":
+        return False
+    for ddl in VERSION_DDL:
+        conn.execute(text(ddl))
+    return True
+
+
+def catalog_version(db):
+    return (
+        db.query(models.CatalogVersion.version)
+        .filter(models.CatalogVersion.name == "course_name")
+        .scalar()
+    )
+
+
+def course_facets(db):
+    """University, study-permit and course facets for the search sidebar.
+
+    Served from memory while the catalog version is unchanged; without a
+    version (no triggers on this database) they are computed every time.
+    """
+    version = catalog_version(db)
+    if version is not None and _cache.get("version") == version:
+        return _cache["facets"]
+
+    facets = compute_facets(db)
+    if version is not None:
+        _cache.update(version=version, facets=facets)
+    return facets
+
+
+def compute_facets(db):
+    # One grouped scan feeds all three facet lists.
+    rows = (
+        db.query(
+            models.CourseName.uni_name,
+            models.CourseName.study_permit,
+            models.CourseName.course_name,
+            func.count(models.CourseName.id),
+        )
+        .group_by(
+            models.CourseName.uni_name,
+            models.CourseName.study_permit,
+            models.CourseName.course_name,
+        )
+        .all()
+    )
+
+    universities, permits, courses = {}, {}, {}
+    for uni_name, study_permit, course_name, count in rows:
+        # Permit and course facets count courses with a university, as
+        # count(uni_name) did.
+        with_uni = count if uni_name is not None else 0
+        universities[uni_name] = universities.get(uni_name, 0) + count
+        permits[study_permit] = permits.get(study_permit, 0) + with_uni
+        courses[course_name] = courses.get(course_name, 0) + with_uni
+
+    return {
+        "uni_data": _facet_list(universities),
+        "permit_data": _facet_list(permits),
+        "course_data": _facet_list(courses),
+    }
+
+
+def _facet_list(counts):
+    # Same order as the GROUP BY it replaces: NULL first, then ascending.
+    names = sorted(counts, key=lambda name: (name is not None, name))
+    return [{"id": i + 1, "name": name, "count": counts[name]} for i, name in enumerate(names)]
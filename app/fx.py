@@ -0,0 +1,133 @@
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+EXCHANGE_RATE_API_URL = "https://api.exchangerate-api.com/v4/latest/"
+
+# Offline rates (units of INR per unit of currency) used by the stub backend.
+STUB_INR_RATES = {
+    "INR": 1.0,
+    "USD": 83.0,
+    "CAD": 61.0,
+    "AUD": 55.0,
+    "NZD": 50.0,
+    "GBP": 105.0,
+    "EUR": 90.0,
+}
+
+
+class ExchangeRateApiBackend:
+    """Fetches the rate table for a base currency from exchangerate-api."""
+
+    def __init__(self, url=EXCHANGE_RATE_API_URL, timeout=10.0):
+        self.url = url
+        self.timeout = timeout
+        self._client = None
+
+    async def fetch(self, base):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        response = await self._client.get(self.url + base)
+        response.raise_for_status()
+        return response.json()["rates"]
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class StubRateBackend:
+    """Local backend for tests and offline runs, quoting every rate via INR."""
+
+    def __init__(self, inr_rates=None):
+        self.inr_rates = {k.upper(): float(v) for k, v in (inr_rates or STUB_INR_RATES).items()}
+
+    async def fetch(self, base):
+        if base not in self.inr_rates:
+            raise KeyError(f"No stub rate for {base}")
+        base_in_inr = self.inr_rates[base]
+        return {quote: base_in_inr / inr for quote, inr in self.inr_rates.items()}
+
+    async def close(self):
+        pass
+
+
+class RateProvider:
+    """TTL-cached, single-flight exchange rates keyed by base currency.
+
+    Concurrent requests for a base whose cache entry is missing or expired
+    share one backend call. If a refresh fails the last known table is
+    served until the backend recovers.
+    """
+
+    def __init__(self, backend, ttl=3600):
+        self.backend = backend
+        self.ttl = ttl
+        self._cache = {}
+        self._inflight = {}
+
+    async def rates(self, base):
+        base = base.upper()
+        cached = self._cache.get(base)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        task = self._inflight.get(base)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(base))
+            self._inflight[base] = task
+            task.add_done_callback(lambda _: self._inflight.pop(base, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, base):
+        try:
+            rates = await self.backend.fetch(base)
+        except Exception:
+            cached = self._cache.get(base)
+            if cached is None:
+                raise
+            return cached[1]
+        self._cache[base] = (time.monotonic() + self.ttl, rates)
+        return rates
+
+    async def rate(self, base, quote="INR"):
+        base, quote = base.upper(), quote.upper()
+        if base == quote:
+            return 1.0
+        value = (await self.rates(base)).get(quote)
+        if value is None:
+            raise KeyError(f"No {quote} rate for {base}")
+        return float(value)
+
+    async def convert(self, curr, amount, quote="INR"):
+        return float(amount) * await self.rate(curr, quote)
+
+    async def convert_many(self, items, quote="INR"):
+        # items: iterable of (currency, amount); each distinct currency is
+        # resolved once, all of them concurrently.
+        items = list(items)
+        currencies = {curr.upper() for curr, _ in items}
+        rates = dict(zip(currencies, await asyncio.gather(*(self.rate(c, quote) for c in currencies))))
+        return [float(amount) * rates[curr.upper()] for curr, amount in items]
+
+    def clear(self):
+        self._cache.clear()
+
+
+def backend_from_env():
+    # FX_BACKEND=stub runs offline; FX_STUB_RATES may point at a JSON file of
+    # INR rates to use instead of the built-in table.
+    if os.environ.get("FX_BACKEND", "exchangerate-api") == "stub":
+        path = os.environ.get("FX_STUB_RATES")
+        if path:
+            with open(path, 'r', encoding='utf-8') as file:
+                return StubRateBackend(json.load(file))
+        return StubRateBackend()
+    return ExchangeRateApiBackend(os.environ.get("FX_API_URL", EXCHANGE_RATE_API_URL))
+
+
+fx_rates = RateProvider(backend_from_env(), ttl=int(os.environ.get("FX_CACHE_TTL", "3600")))
@@ -0,0 +1,68 @@
+class GeoIndex:
+    """In-memory index over the countries/states/cities hierarchy.
+
+    Built once from ``address/countries.json`` so every lookup done by the
+    address endpoints and the name -> id resolution for students and agents
+    is a dict hit instead of a walk over the whole list.
+    """
+
+    def __init__(self, countries):
+        self.countries = [{"id": c["id"], "name": c["name"]} for c in countries]
+        self.country_by_id = {}
+        self.state_by_id = {}
+        self.states_by_country = {}
+        self.cities_by_state = {}
+        self.country_ids = {}
+        self.country_state_ids = {}
+        self.state_ids = {}
+        self.currencies = {}
+
+        for country in countries:
+            self.country_by_id[country["id"]] = country
+            self.country_ids.setdefault(_key(country["name"]), country["id"])
+            if country.get("currency"):
+                self.currencies.setdefault(_key(country["name"]), country["currency"])
+            if "states" not in country:
+                continue
+
+            self.states_by_country[country["id"]] = [
+                {"id": state["id"], "name": state["name"]} for state in country["states"]
+            ]
+            for state in country["states"]:
+                self.state_by_id[state["id"]] = state
+                self.country_state_ids.setdefault((country["id"], _key(state["name"])), state["id"])
+                self.state_ids.setdefault(_key(state["name"]), state["id"])
+                if "cities" in state:
+                    self.cities_by_state[state["id"]] = [
+                        {"id": city["id"], "name": city["name"]} for city in state["cities"]
+                    ]
+
+    def states(self, country_id):
+        return self.states_by_country.get(country_id)
+
+    def cities(self, state_id):
+        return self.cities_by_state.get(state_id)
+
+    def country_id(self, country_name):
+        if not country_name:
+            return None
+        return self.country_ids.get(_key(country_name))
+
+    def state_id(self, state_name, country_name=None):
+        # Scoped to the country when one is given, otherwise the first state
+        # with that name anywhere in the hierarchy.
+        if not state_name:
+            return None
+        if country_name is None:
+            return self.state_ids.get(_key(state_name))
+        country_id = self.country_id(country_name)
+        return self.country_state_ids.get((country_id, _key(state_name)))
+
+    def currency(self, country_name):
+        if not country_name:
+            return None
+        return self.currencies.get(_key(country_name))
+
+
+def _key(name):
+    return name.strip().casefold()
@@ -0,0 +1,50 @@
+from sqlalchemy import func, or_, select
+
+from app import models
+
+# Expense amounts are summed as integer paise (cost_paise); the cost string
+# is kept as entered for display.
+
+
+def from_paise(paise):
+    return (paise or 0) / 100
+
+
+async def totals_async(db, *conditions):
+    """Income, expense and net totals in rupees for the matching expenses."""
+    result = await db.execute(
+        select(models.Expense.expendature, func.sum(models.Expense.cost_paise))
+        .where(*conditions)
+        .group_by(models.Expense.expendature)
+    )
+    sums = dict(result.all())
+    income = sums.get(1) or 0
+    expense = sums.get(0) or 0
+    return {
+        'total': from_paise(income - expense),
+        'income': from_paise(income),
+        'expense': from_paise(expense),
+    }
+
+
+def expense_filters(fil):
+    """Compile the /get_expense filters into SQL conditions.
+
+    Categories, sub-categories and status narrow the result together;
+    search matches description, category or sub-category ignoring case
+    and spaces.
+    """
+    conditions = []
+    if fil.category_ids:
+        conditions.append(models.Expense.category_id.in_(fil.category_ids))
+    if fil.sub_category_ids:
+        conditions.append(models.Expense.sub_category_id.in_(fil.sub_category_ids))
+    if fil.status == 0 or fil.status == 1:
+        conditions.append(models.Expense.expendature == fil.status)
+    if fil.search:
+        pattern = fil.search.lower().replace(" ", "")
+        conditions.append(or_(*(
+            func.replace(func.lower(column), " ", "").contains(pattern, autoescape=True)
+            for column in (models.Expense.description, models.Expense.category, models.Expense.sub_category)
+        )))
+    return conditions
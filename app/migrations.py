@@ -0,0 +1,80 @@
+import os
+
+from sqlalchemy import inspect, text
+
+from app import models, course_search, documents, facets, passwords, universities
+
+# Schema changes for tables that already exist in deployed databases.
+# create_all() only creates missing tables, so added columns and indexes
+# are applied here; every step is idempotent and runs on startup.
+
+
+def add_column(conn, table, column, ddl):
+    columns = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column in columns:
+        return False
+    conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+    return True
+
+
+def create_index(conn, name, table, *columns, unique=False):
+    unique = "UNIQUE " if unique else ""
+    conn.execute(text(f'CREATE {unique}INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'))
+
+
+def backfill_agent_keys(conn):
+    rows = conn.execute(text("SELECT id, agent FROM users WHERE agent_key IS NULL AND agent IS NOT NULL")).all()
+    if rows:
+        conn.execute(
+            text("UPDATE users SET agent_key = :agent_key WHERE id = :id"),
+            [{"id": id, "agent_key": models.normalize_agent_name(agent)} for id, agent in rows],
+        )
+
+
+def backfill_cost_paise(conn):
+    rows = conn.execute(text("SELECT id, cost FROM expenses WHERE cost_paise IS NULL AND cost IS NOT NULL")).all()
+    updates = [{"id": id, "cost_paise": models.to_paise(cost)} for id, cost in rows]
+    updates = [row for row in updates if row["cost_paise"] is not None]
+    if updates:
+        conn.execute(text("UPDATE expenses SET cost_paise = :cost_paise WHERE id = :id"), updates)
+
+
+def hash_plaintext_passwords(conn):
+    rows = conn.execute(text("SELECT id, password FROM credentials WHERE password IS NOT NULL")).all()
+    updates = [
+        {"id": id, "password": passwords.hash_password(password)}
+        for id, password in rows
+        if not passwords.is_hashed(password)
+    ]
+    if updates:
+        conn.execute(text("UPDATE credentials SET password = :password WHERE id = :id"), updates)
+
+
+def rekey_universities(conn):
+    # Names were first unique across all countries, which left out every
+    # university listed under more than one; they are unique per country
+    # now. A table seeded under the old key gets the left-out entries once.
+    indexes = {index["name"] for index in inspect(conn).get_indexes("universities")}
+    conn.execute(text("DROP INDEX IF EXISTS ix_universities_name_key"))
+    create_index(conn, "ix_universities_country_name_key", "universities", "country", "name_key", unique=True)
+    if "ix_universities_name_key" in indexes and os.path.exists(universities.SEED_FILE):
+        universities.import_json(conn, universities.SEED_FILE)
+
+
+def run(engine):
+    with engine.begin() as conn:
+        add_column(conn, "users", "agent_key", "VARCHAR")
+        create_index(conn, "ix_users_agent_key", "users", "agent_key")
+        backfill_agent_keys(conn)
+        course_search.ensure_index(conn)
+        facets.ensure_version_triggers(conn)
+        add_column(conn, "expenses", "cost_paise", "INTEGER")
+        backfill_cost_paise(conn)
+        create_index(conn, "ix_expenses_category_id", "expenses", "category_id")
+        create_index(conn, "ix_expenses_sub_category_id", "expenses", "sub_category_id")
+        create_index(conn, "ix_expenses_expendature", "expenses", "expendature")
+        for document in documents.AGENCY_DOCUMENTS:
+            add_column(conn, "agency_files", f"{document}_sha256", "VARCHAR")
+        hash_plaintext_passwords(conn)
+        create_index(conn, "ix_credentials_email", "credentials", "email")
+        rekey_universities(conn)
@@ -1,7 +1,22 @@
-from sqlalchemy import Column, Integer, String, ForeignKey,JSON,Boolean,VARCHAR,LargeBinary
+from sqlalchemy import Column, Integer, String, ForeignKey,JSON,Boolean,VARCHAR,LargeBinary,Index
 from app.database import Base
 
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+
+def normalize_agent_name(name):
+    # Key used to match students to agents regardless of spacing and case.
+    return name.replace(" ", "").lower() if name else None
+
+
+def to_paise(cost):
+    # Exact integer paise for an amount entered as a rupee string.
+    try:
+        return int((Decimal(str(cost).strip()) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        return None
+
 
 class User(Base):
     __tablename__ = 'users'
@@ -19,11 +34,17 @@ class User(Base):
     passport = Column(String)
     pass_Expiry = Column(String)
     agent = Column(String)
+    agent_key = Column(String, index=True)
     single = Column(String)
     docs = Column(JSON)
     logged_by=Column(String)
     applications = relationship("Application", back_populates="user")
 
+    @validates("agent")
+    def _set_agent_key(self, key, agent):
+        self.agent_key = normalize_agent_name(agent)
+        return agent
+
 class Admin(Base):
     __tablename__ = 'admin'
     id = Column(Integer, primary_key=True, index=True)
@@ -96,8 +117,8 @@ class Credentials(Base):
     __tablename__ = 'credentials'
     id = Column(Integer, primary_key=True, index=True)
     is_admin = Column(Boolean)
-    email = Column(String)
-    password = Column(String)
+    email = Column(String, index=True)
+    password = Column(String)  # scrypt hash, see app.passwords
     token = Column(String)
 
 class Logs(Base):
@@ -135,14 +156,20 @@ class Expense(Base):
     __tablename__ = "expenses"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     description = Column(String)
-    category_id=Column(Integer)
+    category_id=Column(Integer, index=True)
     category = Column(String)
-    sub_category_id = Column(Integer)
+    sub_category_id = Column(Integer, index=True)
     sub_category = Column(String)
     cost = Column(String)
+    cost_paise = Column(Integer)
     log_by = Column(String)
     date = Column(String)
-    expendature = Column(Integer)
+    expendature = Column(Integer, index=True)
+
+    @validates("cost")
+    def _set_cost_paise(self, key, cost):
+        self.cost_paise = to_paise(cost)
+        return cost
     
 class Category(Base):
     __tablename__ = "category"
@@ -173,4 +200,79 @@ class UploadedFile(Base):
     address=Column(String,index=True)
     pincode=Column(String,index=True)
     file_name = Column(String, index=True)
-    file_path = Column(String, index=True)
\ No newline at end of file
+    file_path = Column(String, index=True)
+
+class AgencyFiles(Base):
+    __tablename__ = "agency_files"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(Integer, index=True)
+    agency_name = Column(String, index=True)
+    mail = Column(String)
+    phone = Column(String)
+    city = Column(String)
+    address = Column(String)
+    pincode = Column(String)
+    cancel_check_path = Column(String)
+    pan_card_path = Column(String)
+    company_registration_path = Column(String)
+    aadhar_card_path = Column(String)
+    gst_certificate_path = Column(String)
+    # Content hashes of the documents in the blob store (see app.documents)
+    cancel_check_sha256 = Column(String)
+    pan_card_sha256 = Column(String)
+    company_registration_sha256 = Column(String)
+    aadhar_card_sha256 = Column(String)
+    gst_certificate_sha256 = Column(String)
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    jti = Column(String, primary_key=True)
+    email = Column(String, index=True)
+    role = Column(String)
+    expires_at = Column(String, index=True)
+    revoked = Column(Integer, default=0)
+
+
+class DocumentBlob(Base):
+    __tablename__ = "document_blobs"
+    sha256 = Column(String, primary_key=True)
+    size = Column(Integer)
+    content_type = Column(String)
+    ref_count = Column(Integer, default=0)
+    touched_at = Column(String)
+
+class University(Base):
+    __tablename__ = "universities"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    name = Column(String)
+    name_key = Column(String)
+    country = Column(String, index=True)
+    __table_args__ = (Index("ix_universities_country_name_key", "country", "name_key", unique=True),)
+
+
+class DashboardCounter(Base):
+    __tablename__ = "dashboard_counters"
+    key = Column(String, primary_key=True)
+    value = Column(Integer, default=0)
+
+
+class CatalogVersion(Base):
+    __tablename__ = "catalog_versions"
+    name = Column(String, primary_key=True)
+    version = Column(Integer, default=0)
+
+
+class ExportJob(Base):
+    __tablename__ = "export_jobs"
+    id = Column(String, primary_key=True)
+    status = Column(String, index=True)  # queued, running, done, failed
+    format = Column(String)
+    params = Column(JSON)
+    rows_written = Column(Integer, default=0)
+    total_rows = Column(Integer)
+    file_path = Column(String)
+    error = Column(String)
+    created_at = Column(String)
+    finished_at = Column(String)
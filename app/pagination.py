@@ -0,0 +1,115 @@
+import base64
+import json
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class Page:
+    def __init__(self, rows, paginated=False, next_cursor=None, total=None):
+        self.rows = rows
+        self.paginated = paginated
+        self.next_cursor = next_cursor
+        self.total = total
+
+    def attach(self, response):
+        # Listing responses only grow a "page" block when the client asked
+        # for a page, so unpaginated callers see the old payload.
+        if self.paginated:
+            response["page"] = {"next_cursor": self.next_cursor, "total": self.total}
+        return response
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(token, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _paginating(params):
+    return params is not None and (params.limit is not None or params.cursor is not None)
+
+
+def _limit(params):
+    return min(max(params.limit or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+
+
+def _window(query, params, keys, descending, limit):
+    # Works on both ORM Query objects and select() statements.
+    exprs = [func.coalesce(key, "") for key in keys[:-1]] + [keys[-1]]
+    query = query.order_by(None).order_by(*(expr.desc() if descending else expr for expr in exprs))
+    if params.cursor:
+        values = decode_cursor(params.cursor, len(exprs))
+        position = tuple_(*exprs) if len(exprs) > 1 else exprs[0]
+        after = tuple_(*values) if len(exprs) > 1 else values[0]
+        query = query.filter(position < after if descending else position > after)
+    return query.limit(limit + 1)
+
+
+def _page(rows, limit, keys, total):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            [_value(last, key) or "" for key in keys[:-1]] + [_value(last, keys[-1])]
+        )
+    return Page(rows, paginated=True, next_cursor=next_cursor, total=total)
+
+
+def paginate(query, params, *keys, descending=False):
+    """Keyset-paginate ``query`` ordered by ``keys``.
+
+    The last key must be unique (normally the primary key); leading keys
+    are string columns such as dates, with NULL sorted as "". Without a
+    ``limit`` or ``cursor`` in ``params`` the whole result is returned.
+    """
+    if not _paginating(params):
+        return Page(query.all())
+
+    limit = _limit(params)
+    total = query.order_by(None).count() if params.with_total else None
+    rows = _window(query, params, keys, descending, limit).all()
+    return _page(rows, limit, keys, total)
+
+
+async def _fetch(db, statement):
+    result = await db.execute(statement)
+    columns = statement.column_descriptions
+    if len(columns) == 1 and columns[0]["expr"] is columns[0]["entity"]:
+        return result.scalars().all()
+    return result.all()
+
+
+async def paginate_async(db, statement, params, *keys, descending=False):
+    """:func:`paginate` for a ``select()`` statement run on an AsyncSession."""
+    if not _paginating(params):
+        return Page(await _fetch(db, statement))
+
+    limit = _limit(params)
+    total = None
+    if params.with_total:
+        count = select(func.count()).select_from(statement.order_by(None).subquery())
+        total = (await db.execute(count)).scalar_one()
+    rows = await _fetch(db, _window(statement, params, keys, descending, limit))
+    return _page(rows, limit, keys, total)
+
+
+def _value(row, key):
+    # Rows that pair an entity with extra columns, e.g. (CourseName, rank),
+    # carry the entity's own keys on the entity.
+    try:
+        return getattr(row, key.key)
+    except AttributeError:
+        return getattr(row[0], key.key)
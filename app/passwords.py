@@ -0,0 +1,84 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+# Stored as scrypt$<n>$<r>$<p>$<salt>$<key>. Raising PASSWORD_SCRYPT_N makes
+# new hashes slower; existing ones are upgraded at the user's next login.
+SCHEME = "scrypt"
+SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.environ.get("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("PASSWORD_SCRYPT_P", "1"))
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+# scrypt releases the GIL; a small dedicated pool caps how much CPU a burst
+# of logins can take. Callers await it, so waiting logins hold neither the
+# event loop nor a thread of the threadpool the other endpoints share.
+_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password")
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + (1 << 20), dklen=KEY_BYTES
+    )
+
+
+def hash_password(password):
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"{SCHEME}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}"
+
+
+def is_hashed(stored):
+    return bool(stored) and stored.startswith(f"{SCHEME}$")
+
+
+def needs_rehash(stored):
+    return not stored.startswith(f"{SCHEME}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+def verify_password(password, stored):
+    try:
+        scheme, n, r, p, salt, key = stored.split("$")
+        if scheme != SCHEME:
+            return False
+        expected = base64.b64decode(key)
+        actual = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+@lru_cache(maxsize=1)
+def _dummy_hash():
+    return hash_password("")
+
+
+def _verify_dummy(password):
+    # Runs on the pool, so the one-off dummy hash is computed there too.
+    verify_password(password, _dummy_hash())
+    return False
+
+
+async def verify(password, stored):
+    """Check ``password`` on the hashing pool.
+
+    ``stored`` is None for an unknown user; a dummy hash is checked instead
+    so the response takes as long as for a real account.
+    """
+    if stored is None:
+        return await asyncio.wrap_future(_pool.submit(_verify_dummy, password))
+    return await asyncio.wrap_future(_pool.submit(verify_password, password, stored))
+
+
+async def rehash(password):
+    return await asyncio.wrap_future(_pool.submit(hash_password, password))
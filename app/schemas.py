@@ -1,8 +1,14 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel,Field
 
 
 
+class PageParams(BaseModel):
+    # Keyset pagination; leave limit and cursor unset to get every row
+    cursor: Optional[str] = Field(None)
+    limit: Optional[int] = Field(None)
+    with_total: bool = Field(False)
+
 class Item(BaseModel):
     data: dict
 class User(BaseModel):
@@ -79,6 +85,9 @@ class Credentials(BaseModel):
     password:str
     token:Optional[str]=Field(None)
 
+class RefreshToken(BaseModel):
+    refresh_token:str
+
 class application_status(BaseModel):
     id:int
     name:str
@@ -89,12 +98,12 @@ class Logs(BaseModel):
     timestamp:str
     details:str
 
-class ApplicationQuery(BaseModel):
+class ApplicationQuery(PageParams):
     agent_id:Optional[List[int]] = None
     name: Optional[str] = None
     ids: Optional[List[int]] = None
 
-class CourseSearch(BaseModel):
+class CourseSearch(PageParams):
     global_search:Optional[str] = None
     course_name: Optional[List[str]] = None
     board: Optional[str] = None
@@ -113,13 +122,24 @@ class csv(BaseModel):
     Agent_list:Optional[List[int]]=None
     Application_list:Optional[List[int]]
 
-class AgentWiseStudent(BaseModel):
+class AgentWiseStudent(PageParams):
     agent_id:Optional[List[int]] = None
     name:Optional[str]=Field(None)
     application_id:Optional[str] = Field(None)
 
 
-class commission_get(BaseModel):
+class ExportRequest(BaseModel):
+    agent_id:Optional[List[int]] = None
+    application_id:Optional[str] = Field(None)  # JSON-encoded list of ids
+    format:Optional[str] = Field("xlsx")  # xlsx or csv
+
+
+class ExportJobCreate(BaseModel):
+    agent_id:Optional[List[int]] = None
+    application_id:Optional[List[int]] = None
+    format:str = Field("xlsx")  # xlsx, csv or parquet
+
+class commission_get(PageParams):
     # Agent_list: Optional[List[int]] = None
     # application_list:Optional[List[int]]=None
     # pay_recieve:Optional[int]=None
@@ -127,9 +147,17 @@ class commission_get(BaseModel):
     paid_status:Optional[int] = Field(None)
     agent_ids : Optional[List[int]]= None
     
-class select_commission(BaseModel):
+class select_commission(PageParams):
     data:Optional[List[dict]]=None
     action:bool = Field(None)
+
+class commission_simulate(BaseModel):
+    # Scenario applied to every pending commission; unset fields keep the
+    # stored value. rates overrides rate for the currencies it lists.
+    rate:Optional[float] = Field(None)
+    rates:Optional[Dict[str, float]] = None
+    tds:Optional[float] = Field(None)
+    gst:Optional[float] = Field(None)
     
 class change_status_fee(BaseModel):
     id:int
@@ -143,7 +171,7 @@ class expense(BaseModel):
     date : str
     expendature :int  # 0 or 1
 
-class getExpenses(BaseModel):
+class getExpenses(PageParams):
     category_ids:Optional[List[int]]=None
     sub_category_ids:Optional[List[int]]=None
     search:Optional[str] = Field(None)
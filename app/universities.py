@@ -0,0 +1,136 @@
+import json
+import sys
+from collections import Counter
+
+from sqlalchemy import insert, select
+
+from app import models
+from app.database import upsert
+
+SEED_FILE = "address/universities.json"
+
+
+class UniversityCatalog:
+    """Country-bucketed index over the ``universities`` table.
+
+    Keeps the ``/universities`` payload for every country ready to return
+    (ids are the 1-based position within the country and never change once
+    assigned) and a set of ``(country, case-folded name)`` keys for the
+    duplicate checks; the same name may be listed under several countries.
+    Adding a university is a single INSERT in the caller's transaction; the
+    unique ``(country, name_key)`` index settles races between workers.
+    """
+
+    def __init__(self, universities=()):
+        self.payloads = {}
+        self.names = set()
+        self.last_id = 0
+        for uni in universities:
+            self._index(uni)
+
+    @classmethod
+    def load(cls, db, filename=None):
+        # The JSON file is only used to seed an empty table.
+        if filename and db.query(models.University.id).first() is None:
+            import_json(db, filename)
+            db.commit()
+        catalog = cls()
+        catalog.refresh(db)
+        return catalog
+
+    def refresh(self, db):
+        # Picks up rows added by other workers since the last call.
+        rows = (
+            db.query(models.University)
+            .filter(models.University.id > self.last_id)
+            .order_by(models.University.id)
+            .all()
+        )
+        for row in rows:
+            self._index({"name": row.name, "country": row.country})
+            self.last_id = row.id
+
+    def _index(self, uni):
+        payload = self.payloads.setdefault(uni["country"], [])
+        payload.append({"id": len(payload) + 1, "name": uni["name"].upper()})
+        self.names.add((uni["country"], _key(uni["name"])))
+
+    def __contains__(self, entry):
+        name, country = entry
+        return (country, _key(name)) in self.names
+
+    def payload(self, country):
+        return self.payloads.get(country, [])
+
+    def add(self, db, name, country):
+        """Add ``name`` under ``country`` unless it is already listed there.
+
+        The row is written in ``db``'s transaction for the caller to commit;
+        the catalog picks it up on the next :meth:`refresh`.
+        """
+        if (name, country) in self:
+            return False
+        inserted = db.execute(
+            upsert(db, models.University)
+            .values(name=name, name_key=_key(name), country=country)
+            .on_conflict_do_nothing(index_elements=["country", "name_key"])
+        )
+        return inserted.rowcount > 0
+
+
+def import_json(db, filename):
+    """Insert the file's entries that the table does not have yet.
+
+    Every entry is kept, in file order, so each country lists what the file
+    lists. The file repeats some names within a country; only the first row
+    of a name gets a ``name_key``, the repeats keep NULL, which the unique
+    index does not compare. ``db`` is a Session or a Connection; the caller
+    commits.
+    """
+    with open(filename, 'r', encoding='utf-8') as file:
+        universities = json.load(file)
+
+    present = Counter(
+        (country, _key(name))
+        for name, country in db.execute(select(models.University.name, models.University.country))
+    )
+    seen = Counter()
+    rows = []
+    for uni in universities:
+        key = (uni["country"], _key(uni["name"]))
+        seen[key] += 1
+        if seen[key] <= present[key]:
+            continue
+        first = seen[key] == 1 and not present[key]
+        rows.append({"name": uni["name"], "name_key": key[1] if first else None, "country": uni["country"]})
+    if rows:
+        db.execute(insert(models.University), rows)
+    return len(rows)
+
+
+def export_json(db, filename):
+    rows = db.query(models.University.name, models.University.country).order_by(models.University.id)
+    with open(filename, 'w', encoding='utf-8') as file:
+        json.dump([{"name": name, "country": country} for name, country in rows], file, indent=4)
+
+
+def _key(name):
+    return name.strip().casefold()
+
+
+if __name__ == "__main__":
+    # python -m app.universities import|export [address/universities.json]
+    from app.database import engine, SessionLocal
+
+    command = sys.argv[1]
+    filename = sys.argv[2] if len(sys.argv) > 2 else SEED_FILE
+    models.Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        if command == "import":
+            imported = import_json(db, filename)
+            db.commit()
+            print(f"Imported {imported} universities")
+        elif command == "export":
+            export_json(db, filename)
+        else:
+            sys.exit(f"Unknown command: {command}")
@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+
+
+class StagedFile:
+    def __init__(self, temp, destination, size, sha256):
+        self.temp = temp
+        self.destination = destination
+        self.size = size
+        self.sha256 = sha256
+
+
+def _write(out, digest, chunk):
+    out.write(chunk)
+    digest.update(chunk)
+
+
+def _discard(path):
+    Path(path).unlink(missing_ok=True)
+
+
+def publish(temp, destination):
+    # Make the staged bytes durable before the rename exposes them.
+    fd = os.open(temp, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(temp, destination)
+
+
+async def stage(file, destination, max_bytes=MAX_UPLOAD_BYTES):
+    """Stream ``file`` to a temp name beside ``destination``.
+
+    Chunks are read asynchronously and written and hashed on the threadpool,
+    so the event loop never blocks on disk. Raises 413 once the upload goes
+    over ``max_bytes``; the partial file is removed on any failure.
+    """
+    destination = Path(destination)
+    temp = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    out = await run_in_threadpool(open, temp, "wb")
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"{file.filename} is larger than {max_bytes} bytes.",
+                )
+            await run_in_threadpool(_write, out, digest, chunk)
+        await run_in_threadpool(out.close)
+    except BaseException:
+        out.close()
+        await run_in_threadpool(_discard, temp)
+        raise
+    return StagedFile(temp, destination, size, digest.hexdigest())
+
+
+async def stage_all(uploads, max_bytes=MAX_UPLOAD_BYTES):
+    """Stage ``{key: (UploadFile, destination)}`` concurrently.
+
+    Returns ``{key: StagedFile}``; if any upload fails every staged temp
+    file is removed and the first error is raised.
+    """
+    keys = list(uploads)
+    results = await asyncio.gather(
+        *(stage(file, destination, max_bytes) for file, destination in uploads.values()),
+        return_exceptions=True,
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        await discard_all(result for result in results if isinstance(result, StagedFile))
+        raise errors[0]
+    return dict(zip(keys, results))
+
+
+async def discard_all(staged_files):
+    for staged in staged_files:
+        await run_in_threadpool(_discard, staged.temp)
+
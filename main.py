@@ -1,34 +1,52 @@
 from fastapi import FastAPI, UploadFile, Form, HTTPException
 from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from pathlib import Path
 from typing import List
 import shutil
+import os
+import mimetypes
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 import traceback
-from jose import jwt, JWTError
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import File, Depends, status, Request, Query, Response
-from app import models, schemas
-from app.database import engine, SessionLocal
+from app import models, schemas, counters, migrations, course_search, facets, exports, export_jobs, ledger, commission_engine, documents, downloads, auth, passwords
+from app.database import engine, SessionLocal, get_read_db, async_read_engine, get_async_read_db
+from app.geo import GeoIndex
+from app.universities import SEED_FILE, UniversityCatalog
+from app.fx import fx_rates
+from app.pagination import paginate, paginate_async
+from app.auth import create_access_token, get_claims, get_role
 from sqlalchemy.orm import Session
-from sqlalchemy import  desc , and_, distinct, func, or_, cast, Date
+from sqlalchemy import  desc , and_, distinct, func, or_, cast, Date, select
 import re
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 import json
-import jwt
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import openpyxl
 from datetime import datetime, timedelta
 import pandas as pd
-import requests
 import pytz
 from io import BytesIO
-app = FastAPI()
+from contextlib import asynccontextmanager
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await fx_rates.backend.close()
+    await async_read_engine.dispose()
+    export_jobs.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -50,6 +68,11 @@ app.add_middleware(
 
 # Create database tables
 models.Base.metadata.create_all(engine)
+migrations.run(engine)
+with SessionLocal() as db:
+    counters.ensure(db)
+    export_jobs.cleanup(db)
+    auth.load_revocations(db)
 
 
 # Dependency to get database session
@@ -69,15 +92,8 @@ def get_time():
 
 async def currency_convert(curr, amount):
     # created by Harshil on 1-09
-    url = "https://api.exchangerate-api.com/v4/latest/"
-    response = requests.get(url + f"{curr}")
-    res = response.json()
-    indian_val = res["rates"].get("INR", None)
-    ind_val = float(indian_val)
-    amount = float(amount)
+    return await fx_rates.convert(curr, amount)
 
-    final_val = amount * ind_val
-    return final_val
 
 # <----Validations---->
 NAME_REGEX = re.compile(r"^[a-zA-Z_]+(?: [a-zA-Z_]+)*$")
@@ -110,69 +126,37 @@ statuses = [
     {"id": 21, "label": "Refund Processed"},
     {"id": 22, "label": "Pending document"}
 ]
+STATUS_LABELS = {status["id"]: status["label"] for status in statuses}
 
 
-async def get_role_from_token(request: Request):
-    headers = dict(request.headers)
-    token_with_bearer = headers.get("authorization")
-    if not token_with_bearer:
-        data = {'message': "Not Found",
-                'data': "Not found"}
-        return JSONResponse(
-            status_code=404,
-            content=data
-        )
-    final_token = token_with_bearer.replace("Bearer ", "")
-    payload = jwt.decode(final_token, options={"verify_signature": False})
-    role_name = payload.get("Role")
-    if not role_name:
-        data = {'message': "Not Found",
-                'data': "Not found"}
-        return JSONResponse(
-            status_code=404,
-            content=data
-        )
-
-    return role_name
 # Address details
 def load_json(filename):
     with open(filename, 'r', encoding='utf-8') as file:
         return json.load(file)
 
 
-data = load_json('address/countries.json')
+geo = GeoIndex(load_json('address/countries.json'))
 
 
 @app.get("/countries")
 async def get_countries():
-    return {'status': 200, 'data': [{"id": country["id"], "name": country["name"]} for country in data],
-            'message': 'Success'}
+    return {'status': 200, 'data': geo.countries, 'message': 'Success'}
 
 
 @app.get("/countries/{country_id}/states")
 async def get_states(country_id: int):
-    for country in data:
-        if country["id"] == country_id:
-            if "states" in country:
-                return {'status': 200,
-                        'data': [{"id": state["id"], "name": state["name"]} for state in country["states"]],
-                        'message': 'Success'}
-            else:
-                return {'status': 404, 'data': [], 'message': 'No states found for this country'}
+    states = geo.states(country_id)
+    if states is None:
+        return {'status': 404, 'data': [], 'message': 'No states found for this country'}
+    return {'status': 200, 'data': states, 'message': 'Success'}
 
 
 @app.get("/states/{state_id}/cities")
 async def get_cities(state_id: int):
-    for country in data:
-        if "states" in country:
-            for state in country["states"]:
-                if state["id"] == state_id:
-                    if "cities" in state:
-                        return {'status': 200,
-                                'data': [{"id": city["id"], "name": city["name"]} for city in state["cities"]],
-                                'message': 'Success'}
-                    else:
-                        return {'status': 404, 'data': [], 'message': 'No cities found for this state'}
+    cities = geo.cities(state_id)
+    if cities is None:
+        return {'status': 404, 'data': [], 'message': 'No cities found for this state'}
+    return {'status': 200, 'data': cities, 'message': 'Success'}
 
 
 # Docs Dropdown
@@ -186,7 +170,7 @@ async def create_option(option: schemas.DropdownOptionCreate, db: Session = Depe
 
 
 @app.get("/docs/")
-async def read_options(db: Session = Depends(get_db)):
+async def read_options(db: Session = Depends(get_read_db)):
     options = db.query(models.DocsDropdown).all()
     return {'status': 200, 'data': options, 'message': 'Success'}
 
@@ -273,6 +257,7 @@ async def app_status_update(
             pay_recieve=0,
         )
         db.add(db_commission)
+        counters.status_changed(db, db_user.status, app_status.name)
         db_user.status = app_status.name
         db.commit()
         db.refresh(db_commission)
@@ -294,6 +279,7 @@ async def app_status_update(
         if db_agent:
             db.delete(db_agent)
 
+    counters.status_changed(db, db_user.status, app_status.name)
     db_user.status = app_status.name
     db.commit()
     db.refresh(db_user)
@@ -303,76 +289,57 @@ async def app_status_update(
         "message": "Application Status Updated",
     }
     
-# Session handling
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-SECRET_KEY = "09d25e094faa****************f7099f6f0f4caa6cf63b88e8d3e7"
-ALGORITHM = "HS256"
-
-def create_access_token(data: dict):
-    try:
-        to_encode = data.copy()
-        SECRET_KEY = "09d25e094faa****************f7099f6f0f4caa6cf63b88e8d3e7"
-
-        # encryption algorithm
-        ALGORITHM = "HS256"
-        # expire time of the token - set to 100 years
-        expire = datetime.utcnow() + timedelta(minutes=2)
-
-        to_encode.update({"exp": expire})
-        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+# Login route
+def _find_credentials(db, email):
+    db_user = (
+        db.query(models.Credentials.id, models.Credentials.password, models.Credentials.is_admin)
+        .filter(models.Credentials.email == email)
+        .first()
+    )
+    # End the read transaction before the hash, so a burst of logins never
+    # holds SQLite locks while waiting on the password pool.
+    db.commit()
+    return db_user
 
-        # return the generated token
-        return encoded_jwt
-    except Exception as e:
-        logger.error("Error creating access token: %s", e)
-        raise HTTPException(status_code=500, detail="Internal Server Error")
-    
 
-def verify_access_token(token: str = Depends(oauth2_scheme)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        exp = payload.get("exp")
-        if exp is None:
-            raise HTTPException(status_code=401, detail="Token has no expiration time")
-        
-        if datetime.utcnow() > datetime.utcfromtimestamp(exp):
-            raise HTTPException(status_code=401, detail="Token has expired")
-        
-        return payload
+def _record_login(db, db_user, email, position, new_hash):
+    if new_hash:
+        db.query(models.Credentials).filter(models.Credentials.id == db_user.id).update(
+            {models.Credentials.password: new_hash}, synchronize_session=False
+        )
+    refresh_token = auth.issue_refresh_token(db, email, position)
+    db.commit()
+    return refresh_token
 
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
 
-# Login route
 @app.post("/login")
-def login(user: schemas.Credentials, db: Session = Depends(get_db)):
+async def login(user: schemas.Credentials, db: Session = Depends(get_db)):
     try:
-        db_user = db.query(models.Credentials).filter(models.Credentials.email == user.email).first()
-        if db_user:
-            if db_user.password == user.password:
-                position = 'Admin' if db_user.is_admin else 'Employee'
-                data = {
-                    'Role': position,
-                    'email': user.email
-                }
-                token = create_access_token(data=data)
-                content = {'message': "Login Successful",
-                           'data': {"role": position, "email": user.email, "token": token}}
-
-                response = JSONResponse(
-                    status_code=200,
-                    content=content
-                )
-                response.headers["Authorization"] = f"Bearer {token}"
-                return response
-
-            elif db_user.password != user.password:
-                data = {'message': "Incorrect username or password",
-                        'data': "Incorrect username or password"}
-                return JSONResponse(
-                    status_code=401,
-                    content=data
-                )
+        # Queries run in the threadpool and the hash is awaited on the
+        # password pool, so the event loop never blocks on either.
+        db_user = await run_in_threadpool(_find_credentials, db, user.email)
+        # Unknown emails are checked against a dummy hash and cost the same
+        if await passwords.verify(user.password, db_user.password if db_user else None):
+            new_hash = None
+            if passwords.needs_rehash(db_user.password):
+                new_hash = await passwords.rehash(user.password)
+            position = 'Admin' if db_user.is_admin else 'Employee'
+            data = {
+                'Role': position,
+                'email': user.email
+            }
+            token = create_access_token(data=data)
+            refresh_token = await run_in_threadpool(_record_login, db, db_user, user.email, position, new_hash)
+            content = {'message': "Login Successful",
+                       'data': {"role": position, "email": user.email, "token": token,
+                                "refresh_token": refresh_token}}
+
+            response = JSONResponse(
+                status_code=200,
+                content=content
+            )
+            response.headers["Authorization"] = f"Bearer {token}"
+            return response
         else:
             data = {'message': "Incorrect username or password",
                     'data': "Incorrect username or password"}
@@ -384,67 +351,59 @@ def login(user: schemas.Credentials, db: Session = Depends(get_db)):
         logger.error("Error during login: %s", e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+@app.post("/token/refresh")
+def refresh_token(body: schemas.RefreshToken, db: Session = Depends(get_db)):
+    # No credential lookup: the refresh token is verified and rotated
+    claims, token, refresh_token = auth.rotate_refresh_token(db, body.refresh_token)
+    content = {'message': "Token Refreshed",
+               'data': {"role": claims["Role"], "email": claims["email"], "token": token,
+                        "refresh_token": refresh_token}}
+    response = JSONResponse(status_code=200, content=content)
+    response.headers["Authorization"] = f"Bearer {token}"
+    return response
+
+
+@app.post("/token/revoke")
+def revoke_token(body: schemas.RefreshToken, db: Session = Depends(get_db)):
+    auth.revoke_refresh_token(db, body.refresh_token)
+    return {'status': 200, 'data': "Token Revoked", 'message': "Token Revoked"}
+
 # </----Login----/>
 
 
 # <----Dashboard----->
-@app.get("/Dashboard/")
-async def Dashboard(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    logger.info("Dashboard endpoint called.")
-    
-    # Verify the JWT token
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired or is invalid",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+FULL_OFFER_STATUSES = ("Full Offer", "Visa Granted", "UnConditional Offer Letter")
 
-    try:
-        timestamps = db.query(models.Application.timestamp).all()
-        timestamps = [t[0] for t in timestamps]
-        logger.info(f"Fetched {len(timestamps)} timestamps.")
-    except Exception as e:
-        logger.error(f"Error fetching timestamps: {e}")
-        return {'status': 500, 'message': 'Error fetching timestamps'}
 
-    try:
-        df = pd.DataFrame(timestamps, columns=['timestamp'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['month'] = df['timestamp'].dt.month
-        month_counts = df['month'].value_counts().sort_index()
-        logger.info("Processed timestamps into month_counts.")
-    except Exception as e:
-        logger.error(f"Error processing timestamps: {e}")
-        return {'status': 500 , 'message': 'Error processing timestamps'}
+@app.get("/Dashboard/")
+async def Dashboard(claims: dict = Depends(get_claims), db: AsyncSession = Depends(get_async_read_db)):
+    logger.info("Dashboard endpoint called.")
 
     try:
-        Student_data = db.query(models.User).order_by(desc(models.User.id)).limit(6).all()
-        count_student = db.query(models.User).count()
-        count_application = db.query(models.Application).count()
-        count_agent = db.query(models.agent_data).count()
-        count_done_application = db.query(models.Application).filter(models.Application.status == "Full Offer").count()
-        count_done_application_grant = db.query(models.Application).filter(models.Application.status == "Visa Granted").count()
-        count_done_application_unconditional = db.query(models.Application).filter(models.Application.status == "UnConditional Offer Letter").count()
-        count_done_application = count_done_application + count_done_application_grant + count_done_application_unconditional
-        total_visa_granted = db.query(models.Application).filter(models.Application.status == "Visa Granted").count()
-        
+        counts = await counters.snapshot_async(db)
+        month_counts = dict(sorted(
+            (int(key.split(":", 1)[1]), value)
+            for key, value in counts.items()
+            if key.startswith("month:") and value
+        ))
+        Student_data = (
+            await db.execute(select(models.User).order_by(desc(models.User.id)).limit(6))
+        ).scalars().all()
         logger.info("Fetched all required counts.")
     except Exception as e:
         logger.error(f"Error fetching counts: {e}")
         return {'status': 500, 'message': 'Error fetching counts'}
 
     total_count = {
-        "student_count": count_student,
-        "Application_count": count_application,
-        "Agent_count": count_agent,
-        "Full_Offer": count_done_application,
+        "student_count": counts.get(counters.STUDENTS, 0),
+        "Application_count": counts.get(counters.APPLICATIONS, 0),
+        "Agent_count": counts.get(counters.AGENTS, 0),
+        "Full_Offer": sum(counts.get(counters.status_key(label), 0) for label in FULL_OFFER_STATUSES),
         "data": Student_data,
-        "visa": total_visa_granted
+        "visa": counts.get(counters.status_key("Visa Granted"), 0),
+        "month_data": month_counts,
     }
 
-    logger.info(f"Final response data: {total_count}")
     return {'status': 200, 'data': total_count, 'message': 'Success'}
 
 # </----Dashboard----/>
@@ -454,52 +413,37 @@ class AgentWiseStudent(BaseModel):
 
 
 @app.post("/student")
-async def read_users(student: schemas.AgentWiseStudent, db: Session = Depends(get_db)):
-    agentWiseStudent = []
-    response = []
-    final_result_with_search = []
+async def read_users(student: schemas.AgentWiseStudent, db: AsyncSession = Depends(get_async_read_db)):
     name = student.name
 
     try:
         agent_ids = student.agent_id
         if student.agent_id:
+            agents = (await db.execute(
+                select(models.agent_data.id, models.agent_data.name)
+                .where(models.agent_data.id.in_(agent_ids))
+            )).all()
+            found = {agent.id for agent in agents}
             for id in agent_ids:
-                agent_name = db.query(models.agent_data).filter(models.agent_data.id == id).all()
-                if agent_name:
-                    agentWiseStudent.append(agent_name[0].name.replace(" ", "").lower())
-                else:
+                if id not in found:
                     raise ValueError(f"Agent ID {id} not found in database.")
-            
-            # Getting students with the matching agent names
-            for agent_name in agentWiseStudent:
-                students = db.query(models.User).all()
-                matched_students = [student for student in students if student.agent.replace(" ", "").lower() == agent_name]
-                response.append(matched_students)
-
-            if student.agent_id and name:
-                user_data = db.query(models.User).filter(models.User.name.ilike(f"%{name}%")).all()
 
-                for agent_name in agentWiseStudent:
-                    for student in user_data:
-                        if student.agent.replace(" ", "").lower() == agent_name:
-                            final_result_with_search.append(student)
-
-                return {'status': 200, 'data': final_result_with_search, 'message': 'Success'}
-
-            return {'status': 200, 'data': [item for row in response for item in row], 'message': 'Success'}
+            # Students are matched on the indexed, normalized agent key
+            agent_keys = {models.normalize_agent_name(agent.name) for agent in agents}
+            query = select(models.User).where(models.User.agent_key.in_(agent_keys))
+            if name:
+                query = query.where(models.User.name.ilike(f"%{name}%"))
+            page = await paginate_async(db, query, student, models.User.id)
+            return page.attach({'status': 200, 'data': page.rows, 'message': 'Success'})
         else:
-            student_info = []
-
+            query = select(models.User)
             if name:
-                user_data = db.query(models.User).filter(models.User.name.ilike(f"%{name}%")).all()
-                if not user_data:
-                    return {'status': 200, 'data': [], 'message': 'Success'}
-                else:
-                    return {'status': 200, 'data': user_data, 'message': 'Success'}
-            else:
-                user_data = db.query(models.User).all()
-                student_info.extend(user_data)
-                return {'status': 200, 'data': student_info, 'message': 'Success'}
+                query = query.where(models.User.name.ilike(f"%{name}%"))
+            page = await paginate_async(db, query, student, models.User.id)
+            return page.attach({'status': 200, 'data': page.rows, 'message': 'Success'})
+
+    except HTTPException:
+        raise
 
     except SQLAlchemyError as e:
         # Handle SQLAlchemy-specific exceptions
@@ -513,14 +457,14 @@ async def read_users(student: schemas.AgentWiseStudent, db: Session = Depends(ge
         traceback.print_exc()
         return {'status': 500, 'data': [], 'message': 'An unexpected error occurred'}
 @app.get("/user_name")
-async def user_name(db: Session = Depends(get_db)):
+async def user_name(db: Session = Depends(get_read_db)):
     agent_names = db.query(models.User.id, models.User.name).all()
     agents_list = [{"id": id, "name": name} for id, name in agent_names]
     return {'status': 200, 'data': agents_list, 'message': 'Success'}
 
 
 @app.get("/users/{id}")
-async def get_user(id: int, db: Session = Depends(get_db)):
+async def get_user(id: int, db: Session = Depends(get_read_db)):
     user = db.query(models.User).filter(models.User.id == id).first()
     if not user:
         data = {'message': "Not Found",
@@ -539,35 +483,17 @@ async def get_user(id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/logs/")
-async def get_logs(db: Session = Depends(get_db)):
+async def get_logs(db: Session = Depends(get_read_db)):
     logs = db.query(models.Logs).order_by(desc(models.Logs.id)).limit(4).all()
     return {'status': 200, 'data': logs, 'message': 'Success'}
 
 
-def get_countriesid(data, country_name):
-    for country in data:
-        if country['name'] == country_name:
-            return country['id']
-    return None  # Return None if the country name is not found
-
-
-def get_statesids(data, country_name, state_name):
-    for country in data:
-        if country['name'] == country_name:
-            # If the country name matches, loop through the states in that country
-            for state in country['states']:
-                if state['name'] == state_name:
-                    return state['id']
-    return None  # Return None if the state name is not found within the given country
-
-
 @app.post("/users/")
-async def create_or_update_user(user: schemas.User, request: Request, db: Session = Depends(get_db)):
+async def create_or_update_user(user: schemas.User, role_name: str = Depends(get_role), db: Session = Depends(get_db)):
     state_name = user.state
     country_name = user.country
-    role_name = await get_role_from_token(request)
-    country_ids = get_countriesid(data, country_name)
-    state_ids = get_statesids(data, country_name, state_name)
+    country_ids = geo.country_id(country_name)
+    state_ids = geo.state_id(state_name, country_name)
 
     # print(country_ids)
 
@@ -606,6 +532,7 @@ async def create_or_update_user(user: schemas.User, request: Request, db: Sessio
     db_user.country_id = country_ids
     db_user.state_id = state_ids
     db.add(db_user)
+    counters.bump(db, counters.STUDENTS)
     db.commit()
     db.refresh(db_user)
 
@@ -632,58 +559,38 @@ async def delete_user(user_id: int, db: Session = Depends(get_db)):
             content=data
         )
     db.delete(db_user)
+    counters.bump(db, counters.STUDENTS, -1)
     db.commit()
     return {'status': 204, 'data': 'Student Deleted', 'message': 'Student  Deleted'}
 
 
 # </----Student Details----/>
 @app.get("/agent_name")
-async def agent_name(db: Session = Depends(get_db)):
+async def agent_name(db: Session = Depends(get_read_db)):
     agent_names = db.query(models.agent_data.id, models.agent_data.name).all()
     agents_list = [{"id": id, "name": name} for id, name in agent_names]
     return {'status': 200, 'data': agents_list, 'message': 'Success'}
 
 
 # Agent Details
-def get_stateids(country_data, state_names):
-    state_ids = []
-    for name_tuple in state_names:
-        state_name = name_tuple[0]
-        for country in country_data:
-            for state in country.get("states", []):
-                if state["name"].lower() == state_name.lower():
-                    state_ids.append(state["id"])
-                    break
-    return state_ids
-
-
 @app.post("/agent")
 async def get_all_agent(query: schemas.ApplicationQuery, db: Session = Depends(get_db)):
-    agent_info = []
     if query.name:
-        agents = db.query(models.agent_data).filter(models.agent_data.name.ilike(f"%{query.name}%")).all()
-        if not agents:
-            return {'status': 200, 'data': [], 'message': 'Agent not found'}
+        agents = db.query(models.agent_data).filter(models.agent_data.name.ilike(f"%{query.name}%"))
+        page = paginate(agents, query, models.agent_data.id)
+        if not page.rows:
+            return page.attach({'status': 200, 'data': [], 'message': 'Agent not found'})
         else:
-            return {'status': 200, 'data': agents, 'message': 'Agent found'}
+            return page.attach({'status': 200, 'data': page.rows, 'message': 'Agent found'})
     else:
-        agents = db.query(models.agent_data).all()
-        agent_info.extend(agents)
-        state_name = db.query(models.agent_data.state).all()
-        state_id = get_stateids(data, state_name)
-        for id in state_id:
-            for item in agent_info:
-                item.__dict__['state_id'] = id
-    return {'status': 200, 'data': agent_info, 'message': 'Success'}
-
-
-@app.post("/agents/")
-async def CU_agent(request: Request, agent: schemas.AgentSchema, db: Session = Depends(get_db)):
-    headers = dict(request.headers)
-    token_withBearer = headers["authorization"]
-    final_token = token_withBearer.replace("Bearer ", "")
-    payload = jwt.decode(final_token, options={"verify_signature": False})
+        page = paginate(db.query(models.agent_data), query, models.agent_data.id)
+        for item in page.rows:
+            item.__dict__['state_id'] = geo.state_id(item.state)
+    return page.attach({'status': 200, 'data': page.rows, 'message': 'Success'})
+
 
+@app.post("/agents/", dependencies=[Depends(get_claims)])
+async def CU_agent(agent: schemas.AgentSchema, db: Session = Depends(get_db)):
     if agent.id and agent.id > 0:
         db_agent = db.query(models.agent_data).filter(models.agent_data.id == agent.id).first()
         if db_agent:
@@ -713,6 +620,7 @@ async def CU_agent(request: Request, agent: schemas.AgentSchema, db: Session = D
         # Create new agent without an id
         new_agent = models.agent_data(**agent.dict(exclude={"id"}))
         db.add(new_agent)
+        counters.bump(db, counters.AGENTS)
         db.commit()
         db.refresh(new_agent)
 
@@ -738,12 +646,14 @@ async def delete_agent(id: int, db: Session = Depends(get_db)):
             content=data
         )
     db.delete(user)
+    counters.bump(db, counters.AGENTS, -1)
     db.commit()
     return {'status': 200, 'data': 'Agent Deleted', 'message': 'Agent Deleted'}
 
 
 # <----Applications---->
-uni_data = load_json('address/universities.json')
+with SessionLocal() as db:
+    universities = UniversityCatalog.load(db, SEED_FILE)
 
 
 class UniversityRequest(BaseModel):
@@ -751,20 +661,9 @@ class UniversityRequest(BaseModel):
 
 
 @app.post("/universities")
-async def get_states(request: UniversityRequest):
-    uni_name = request.uni_name
-    data = []
-    count = 0
-    for uni in uni_data:
-        if uni["country"] == uni_name:
-            count += 1
-            university_name = uni["name"].upper()
-            university_data = {
-                "id": count,
-                "name": university_name
-            }
-            data.append(university_data)
-
+async def get_states(request: UniversityRequest, db: Session = Depends(get_read_db)):
+    universities.refresh(db)
+    data = universities.payload(request.uni_name)
     if data:
         return {
             'status': 200,
@@ -778,12 +677,9 @@ async def get_states(request: UniversityRequest):
             'message': 'No Universities Found in this Country'
         }
 @app.post("/add_uni")
-async def add_uni(data:schemas.AddUni):
-    if data.university_name.lower() not in [i["name"].lower() for i in uni_data]:
-        data_to_add = {"name": data.university_name, "country": data.Country}
-        uni_data.append(data_to_add)
-        with open('address/universities.json', 'w') as file:
-            json.dump(uni_data, file, indent=4)
+async def add_uni(data:schemas.AddUni, db: Session = Depends(get_db)):
+    if universities.add(db, data.university_name, data.Country):
+        db.commit()
         return {'status':200,'data':'Successfully Added','message':'Successfully Added'}
     data_res = {'message': 'University is already Present in List',
             'data': "Already Exist"}
@@ -795,7 +691,7 @@ async def add_uni(data:schemas.AddUni):
 
 # Get all applications
 @app.get("/application/{id}")
-async def get_user(id: int, db: Session = Depends(get_db)):
+async def get_user(id: int, db: Session = Depends(get_read_db)):
     logger.info(f"Fetching application with id {id}")
     try:
         user = db.query(models.Application).filter(models.Application.id == id).first()
@@ -814,61 +710,48 @@ async def get_user(id: int, db: Session = Depends(get_db)):
 
 
 @app.post("/application_get")
-async def get_all_applications(query: schemas.ApplicationQuery, db: Session = Depends(get_db)):
+async def get_all_applications(query: schemas.ApplicationQuery, db: AsyncSession = Depends(get_async_read_db)):
     try:
-        filters = []
- 
+        # One joined query, projecting the application columns plus the agent
+        applications = select(*models.Application.__table__.c, models.User.agent).outerjoin(
+            models.User, models.User.id == models.Application.student_id
+        )
+
         # Filter by agent_id
         if query.agent_id:
-            agent_names = [agent.name for agent_id in query.agent_id for agent in db.query(models.agent_data).filter(models.agent_data.id == agent_id).all()]
-            student_ids = [student.id for agent in agent_names for student in db.query(models.User).filter(models.User.agent == agent).all()]
-            application_student_ids = [app.student_id for app in db.query(models.Application.student_id).all()]
-            common_student_ids = set(student_ids).intersection(application_student_ids)
-            filters.append(models.Application.student_id.in_(common_student_ids))
- 
+            agent_names = await db.execute(
+                select(models.agent_data.name).where(models.agent_data.id.in_(query.agent_id))
+            )
+            agent_keys = {models.normalize_agent_name(name) for (name,) in agent_names}
+            applications = applications.where(models.User.agent_key.in_(agent_keys))
+
         # Filter by status IDs if provided
         if query.ids:
-            status_labels = []
-            for id in query.ids:
- 
-                status_labels.append(statuses[id-1]["label"])
-            print(status_labels)
-            if status_labels:
-                filters.append(models.Application.status.in_(status_labels))
- 
+            # Unknown ids match nothing; an empty IN gives an empty page
+            status_labels = [STATUS_LABELS[id] for id in query.ids if id in STATUS_LABELS]
+            applications = applications.where(models.Application.status.in_(status_labels))
+
         # Filter by name if provided
         if query.name:
-            filters.append(models.Application.student_name.ilike(f"%{query.name}%"))
- 
-        # Apply filters to the query
-        query_result = db.query(models.Application).filter(*filters).all()
-        agent_list = []
-                
-        # agent column 
-        
-        for row in query_result:
-            query = db.query(models.User.agent).filter(models.User.id == row.student_id).first()
-            agent_list.append(query)
-        plain_list = [item[0] for item in agent_list]
-        print(plain_list)
-     
-        for agent_name, obj in zip(plain_list, query_result):
-            obj.agent = agent_name 
+            applications = applications.where(models.Application.student_name.ilike(f"%{query.name}%"))
 
+        page = await paginate_async(db, applications, query, models.Application.id)
+        query_result = [row._asdict() for row in page.rows]
         if query_result:
-            return {'status': 200, 'data': query_result, 'message': 'Applications fetched successfully'}
+            return page.attach({'status': 200, 'data': query_result, 'message': 'Applications fetched successfully'})
         else:
-            return {'status': 200, 'data': [], 'message': "No applications found"}
+            return page.attach({'status': 200, 'data': [], 'message': "No applications found"})
  
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching applications: {e}")
         logger.error(traceback.format_exc())  # Logs the full stack trace
         return JSONResponse(status_code=500, content={'message': 'Internal Server Error'})
 
 @app.post("/application")
-async def CU_Applications(application: schemas.Application, request: Request, db: Session = Depends(get_db)):
+async def CU_Applications(application: schemas.Application, role_name: str = Depends(get_role), db: Session = Depends(get_db)):
     try:
-        role_name = await get_role_from_token(request)
         logger.info(f"Role {role_name} is attempting to create or update an application")
 
         user = db.query(models.User).filter(models.User.id == application.student_id).first()
@@ -876,18 +759,12 @@ async def CU_Applications(application: schemas.Application, request: Request, db
             logger.warning(f"No user found with student_id {application.student_id}")
             return {'status': 404, 'data': 'No student with given ID', 'message': 'No student with given ID'}
 
-        if application.university_name not in [i["name"] for i in uni_data]:
-            logger.info(f"Adding new university to uni_data: {application.university_name}")
-            data_to_add = {"name": application.university_name, "country": application.Country}
-            uni_data.append(data_to_add)
-            with open('address/universities.json', 'w') as file:
-                json.dump(uni_data, file, indent=4)
+        if universities.add(db, application.university_name, application.Country):
+            logger.info(f"Added new university to the catalog: {application.university_name}")
 
         rent_time = datetime.utcnow()
         current_time = rent_time.strftime('%Y-%m-%d %H:%M:%S')
-        data = load_json("address/countries.json")
-        
-        
+
         if application.id and application.id > 0:
             logger.info(f"Updating application with id {application.id}")
             db_application = db.query(models.Application).filter(models.Application.id == application.id).first()
@@ -911,17 +788,15 @@ async def CU_Applications(application: schemas.Application, request: Request, db
                 details=f"Application updated for <b>{user.name}</b> by <b>{role_name}</b>"
             )
             db.add(new_log)
-            currency_found = False
-            for con in data:
-                if con["name"] == application.Country:
-                    db_application.curr = con["currency"]
-                    currency_found = True
-                    logger.info(f"Currency for country {application.Country} found: {db_application.curr}")
-                    break  # Exit loop after finding a match
-            if not currency_found:
+            currency = geo.currency(application.Country)
+            if currency:
+                db_application.curr = currency
+                logger.info(f"Currency for country {application.Country} found: {db_application.curr}")
+            else:
                 logger.warning(f"No currency found for country {application.Country}, leaving `curr` unchanged.")
             # Update additional fields
             db_application.student_name = user.name
+            counters.timestamp_changed(db, db_application.timestamp, current_time)
             db_application.timestamp = current_time
             
             try:
@@ -940,17 +815,16 @@ async def CU_Applications(application: schemas.Application, request: Request, db
         else:
             logger.info("Creating new application")
             new_application = models.Application(**application.dict(exclude={"id"}))
-           
-            for con in data:
-                if con["name"] == application.Country:
-                    new_application.curr = con["currency"]
-                    
-                    
+            currency = geo.currency(application.Country)
+            if currency:
+                new_application.curr = currency
+
             new_application.status = "Application Created"
             new_application.student_name = user.name
             new_application.timestamp = current_time
             
             db.add(new_application)
+            counters.application_added(db, new_application.status, current_time)
             db.commit()
             db.refresh(new_application)
 
@@ -981,7 +855,12 @@ async def delete_application(id: int, db: Session = Depends(get_db)):
             status_code=404,
             content=data
         )
+    # Commission records outlive the application they were raised for
+    db.query(models.commission).filter(models.commission.application_id == id).update(
+        {models.commission.application_id: None}, synchronize_session=False
+    )
     db.delete(Application)
+    counters.application_removed(db, Application.status, Application.timestamp)
     db.commit()
     return {'status': 204, 'data': 'Application Deleted', 'message': 'Application Deleted'}
 
@@ -992,197 +871,38 @@ async def delete_application(id: int, db: Session = Depends(get_db)):
 # <----Course Search---->
 
 @app.post("/search_courses/")
-def search_courses(search: schemas.CourseSearch, db: Session = Depends(get_db)):
-    response = []
-    conditions = []
-    final_query = []
-    if search.global_search:
-        final_res = []
-        pattern = search.global_search.replace(" ", "").lower()
-        if search.course_name:
-            name_conditions = [models.CourseName.course_name.ilike(f"%{cname}%") for cname in search.course_name]
-            conditions.append(or_(*name_conditions))
-
-        if search.university_name:
-            uni_conditions = [models.CourseName.uni_name.ilike(f"%{uni}%") for uni in search.university_name]
-            conditions.append(or_(*uni_conditions))
-
-        if search.study_permit:
-            permit_conditions = [models.CourseName.study_permit == permit for permit in search.study_permit]
-            conditions.append(or_(*permit_conditions))
-
-        final_condition = and_(*conditions)
-
-        query = db.query(models.CourseName).filter(final_condition).all()
-
-        response.append(query)
-        final_query = [item for row in response for item in row]
-        if final_query:
-            for i in final_query:
-                course_name = i.course_name.replace(" ", "").lower()
-                uni_name = i.uni_name.replace(" ", "").lower()
-
-                # Use the sanitized pattern
-                if re.search(pattern, course_name, re.IGNORECASE) or re.search(pattern, uni_name, re.IGNORECASE):
-                    final_res.append(i)
-
-            return {'status': 200, 'data': final_res, 'message': 'Success  '}
-        else:
-            query = db.query(models.CourseName).filter(
-                models.CourseName.course_name.ilike(f"%{search.global_search}%")).all()
-            query2 = db.query(models.CourseName).filter(
-                models.CourseName.uni_name.ilike(f"%{search.global_search}%")).all()
-            if query:
-                return {'status': 200, 'data': query, 'message': 'Success  '}
-            if query2:
-                return {'status': 200, 'data': query2, 'message': 'Success  '}
-            else:
-                return {'status': 200, 'data': [], 'message': 'not found'}
-
-    elif search.course_name or search.university_name or search.study_permit:
-        if search.course_name:
-            name_conditions = [models.CourseName.course_name.ilike(f"%{cname}%") for cname in search.course_name]
-            conditions.append(or_(*name_conditions))
-
-        if search.university_name:
-            uni_conditions = [models.CourseName.uni_name.ilike(f"%{uni}%") for uni in search.university_name]
-            conditions.append(or_(*uni_conditions))
-
-        if search.study_permit:
-            permit_conditions = [models.CourseName.study_permit == permit for permit in search.study_permit]
-            conditions.append(or_(*permit_conditions))
-
-        final_condition = and_(*conditions)
-
-        query = db.query(models.CourseName).filter(final_condition).all()
-
-        response.append(query)
-
-        return {'status': 200, 'data': [item for row in response for item in row], 'message': 'Success  '}
-
-    else:
-        query = db.query(models.CourseName).all()
-        return {'status': 200, 'data': query, 'message': 'Success  '}
-
-
 @app.post("/search_courses")
-def search_courses(search: schemas.CourseSearch, db: Session = Depends(get_db)):
-    response = []
+def search_courses(search: schemas.CourseSearch, db: Session = Depends(get_read_db)):
     conditions = []
-    final_query = []
-    if search.global_search:
-        final_res = []
-        pattern = search.global_search.replace(" ", "").lower()
-        if search.course_name:
-            name_conditions = [models.CourseName.course_name.ilike(f"%{cname}%") for cname in search.course_name]
-            conditions.append(or_(*name_conditions))
-
-        if search.university_name:
-            uni_conditions = [models.CourseName.uni_name.ilike(f"%{uni}%") for uni in search.university_name]
-            conditions.append(or_(*uni_conditions))
-
-        if search.study_permit:
-            permit_conditions = [models.CourseName.study_permit == permit for permit in search.study_permit]
-            conditions.append(or_(*permit_conditions))
-
-        final_condition = and_(*conditions)
-
-        query = db.query(models.CourseName).filter(final_condition).all()
-
-        response.append(query)
-        final_query = [item for row in response for item in row]
-        if final_query:
-            for i in final_query:
-                course_name = i.course_name.replace(" ", "").lower()
-                uni_name = i.uni_name.replace(" ", "").lower()
-
-                # Use the sanitized pattern
-                if re.search(pattern, course_name, re.IGNORECASE) or re.search(pattern, uni_name, re.IGNORECASE):
-                    final_res.append(i)
-
-            return {'status': 200, 'data': final_res, 'message': 'Success  '}
-        else:
-            query = db.query(models.CourseName).filter(
-                models.CourseName.course_name.ilike(f"%{search.global_search}%")).all()
-            query2 = db.query(models.CourseName).filter(
-                models.CourseName.uni_name.ilike(f"%{search.global_search}%")).all()
-            if query:
-                return {'status': 200, 'data': query, 'message': 'Success  '}
-            if query2:
-                return {'status': 200, 'data': query2, 'message': 'Success  '}
-            else:
-                return {'status': 200, 'data': [], 'message': 'not found'}
-
-    elif search.course_name or search.university_name or search.study_permit:
-        if search.course_name:
-            name_conditions = [models.CourseName.course_name.ilike(f"%{cname}%") for cname in search.course_name]
-            conditions.append(or_(*name_conditions))
-
-        if search.university_name:
-            uni_conditions = [models.CourseName.uni_name.ilike(f"%{uni}%") for uni in search.university_name]
-            conditions.append(or_(*uni_conditions))
-
-        if search.study_permit:
-            permit_conditions = [models.CourseName.study_permit == permit for permit in search.study_permit]
-            conditions.append(or_(*permit_conditions))
+    if search.course_name:
+        name_conditions = [models.CourseName.course_name.ilike(f"%{cname}%") for cname in search.course_name]
+        conditions.append(or_(*name_conditions))
 
-        final_condition = and_(*conditions)
+    if search.university_name:
+        uni_conditions = [models.CourseName.uni_name.ilike(f"%{uni}%") for uni in search.university_name]
+        conditions.append(or_(*uni_conditions))
 
-        query = db.query(models.CourseName).filter(final_condition).all()
+    if search.study_permit:
+        conditions.append(models.CourseName.study_permit.in_(search.study_permit))
 
-        response.append(query)
-
-        return {'status': 200, 'data': [item for row in response for item in row], 'message': 'Success  '}
-
-    else:
-        query = db.query(models.CourseName).all()
-        return {'status': 200, 'data': query, 'message': 'Success  '}
+    query = db.query(models.CourseName).filter(*conditions)
 
+    if search.global_search:
+        # Ranked prefix match over course and university names, combined
+        # with the sidebar filters in the same statement
+        query, keys = course_search.search(query, search.global_search)
+        page = paginate(query, search, *keys)
+        courses = [row.CourseName for row in page.rows]
+        message = 'Success  ' if courses else 'not found'
+        return page.attach({'status': 200, 'data': courses, 'message': message})
 
+    page = paginate(query, search, models.CourseName.id)
+    return page.attach({'status': 200, 'data': page.rows, 'message': 'Success  '})
 
 
 @app.get("/get_uni")
-async def get_uni_drop(db: Session = Depends(get_db)):
-    uni_data = (
-        db.query(
-            models.CourseName.uni_name,
-            func.count(models.CourseName.id).label('course_count')
-        )
-        .group_by(models.CourseName.uni_name)
-        .all()
-    )
-
-    # Constructing the response
-    agents_list = [
-        {"id": i + 1, "name": uni_name, "count": course_count}
-        for i, (uni_name, course_count) in enumerate(uni_data)
-    ]
-    permit_data = (  # uni_data
-        db.query(
-            models.CourseName.study_permit,
-            func.count(models.CourseName.uni_name).label('course_count')
-        )
-        .group_by(models.CourseName.study_permit)
-        .all()
-    )
-    permit_list = [
-        {"id": i + 1, "name": uni_name, "count": course_count}
-        for i, (uni_name, course_count) in enumerate(permit_data)
-    ]
-    uni_nm_data = (  # uni_data
-        db.query(
-            models.CourseName.course_name,
-            func.count(models.CourseName.uni_name).label('course_count')
-        )
-        .group_by(models.CourseName.course_name)
-        .all()
-    )
-    course_list = [
-        {"id": i + 1, "name": uni_name, "count": course_count}
-        for i, (uni_name, course_count) in enumerate(uni_nm_data)
-    ]
-    return {'status': 200, 'data': {"uni_data": agents_list, "permit_data": permit_list, "course_data": course_list},
-            'message': 'Success'}
+async def get_uni_drop(db: Session = Depends(get_read_db)):
+    return {'status': 200, 'data': facets.course_facets(db), 'message': 'Success'}
 
 
 # @app.post("/csv")
@@ -1298,149 +1018,87 @@ async def get_uni_drop(db: Session = Depends(get_db)):
 #23-12-2024 CSV Update
 
 @app.post("/csv")
-async def get_data(student: schemas.AgentWiseStudent, db: Session = Depends(get_db)):
+def get_data(export: schemas.ExportRequest):
+    fmt = export.format or "xlsx"
+    if fmt not in ("csv", "xlsx"):
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {fmt}")
+    # Ensure application_id is not None before parsing
     try:
-        # Ensure application_id is not None before parsing
-        app_ids = json.loads(student.application_id) if student.application_id else []
-        agent_ids = student.agent_id or []  # Ensure agent_ids is a list even if None
-        
-        output = BytesIO()
-        logging.info(f"Agent IDs received: {agent_ids}")
-
-        # Create an Excel writer
-        writer = pd.ExcelWriter(output, engine='openpyxl')
-
-        if agent_ids:
-            for agent_id in agent_ids:
-                agent = db.query(models.agent_data).filter(models.agent_data.id == agent_id).first()
-                if not agent:
-                    logging.warning(f"Agent ID {agent_id} not found.")
-                    continue
-
-                agent_name = agent.name.replace(" ", "").lower()
-                logging.info(f"Processing agent: {agent.name}")
-
-                # Query student data
-                students = db.query(
-                    models.User.name.label("Name"),
-                    models.User.email.label("Email"),
-                    models.User.phone.label("Phone"),
-                    models.User.agent.label("Agent"),
-                    models.User.address.label("Address"),
-                    models.User.city.label("City"),
-                    models.User.state.label("State"),
-                    models.User.country.label("Country"),
-                    models.User.passport.label("Passport")
-                ).filter(models.User.agent.ilike(f'%{agent.name}%')).all()
-
-                if not students:
-                    logging.info(f"No students found for agent {agent.name}.")
-                    continue
-
-                # Convert query results to DataFrame
-                df = pd.DataFrame([s._asdict() for s in students])
-                df.index += 1
-                df.to_excel(writer, sheet_name=agent_name, index_label="Sr No.")
-
-        if app_ids:
-            applications = db.query(
-                models.Application.student_name.label("Student Name"),
-                models.Application.Country.label("Country"),
-                models.Application.university_name.label("University Name"),
-                models.Application.intake.label("Intake"),
-                models.Application.program_level.label("Program Level"),
-                models.Application.program.label("Program"),
-                models.Application.status.label("Status"),
-                models.Application.yearly_fee.label("Yearly Fee"),
-                models.Application.scholarship.label("Scholarship"),
-                models.User.agent.label("Agent")
-            ).join(models.User, models.Application.student_id == models.User.id) \
-            .filter(models.Application.id.in_(app_ids)).all()
-
-            if applications:
-                df = pd.DataFrame([a._asdict() for a in applications])
-                df.index += 1
-                df.to_excel(writer, sheet_name="Applications", index_label="Sr No.")
-            else:
-                logging.info("No applications found for the provided IDs.")
-
-        writer.close()
-        output.seek(0)
+        app_ids = json.loads(export.application_id) if export.application_id else []
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid application_id")
+    agent_ids = export.agent_id or []  # Ensure agent_ids is a list even if None
+    logging.info(f"Agent IDs received: {agent_ids}")
+
+    # CSV rows are read in batches and sent as they arrive; the generator
+    # opens its own session since it outlives this request handler.
+    if fmt == "csv":
         return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": "attachment; filename=Exported_Data.xlsx"}
+            exports.stream_csv(agent_ids, app_ids),
+            media_type=exports.CSV_MEDIA_TYPE,
+            headers={"Content-Disposition": "attachment; filename=Exported_Data.csv"}
         )
-    except Exception as e:
-        logging.error(f"An error occurred: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+    # An XLSX file is only readable once complete, so the workbook is
+    # built on disk first (still batch by batch) and then sent.
+    path = exports.xlsx_file(agent_ids, app_ids)
+    return FileResponse(
+        path,
+        media_type=exports.XLSX_MEDIA_TYPE,
+        filename="Exported_Data.xlsx",
+        background=BackgroundTask(os.unlink, path),
+    )
 
 
 
-# Visa Granted
-@app.get("/visa/")
-async def get_visa_granted(db: Session = Depends(get_db)):
-    for i in statuses:
-        if i["label"] == "Visa Granted":
-            students1 = (
-                db.query(models.Application)
-                .filter(models.Application.status == i["label"])
-                .order_by(desc(models.Application.id))
-                .all()
-            )
-    return {"status": 200, "data": students1, "message": "Success all "}
-    
-
-
-@app.get("/get_uni")
-async def get_uni_drop(db: Session = Depends(get_db)):
-    uni_data = (
-        db.query(
-            models.CourseName.uni_name,
-            func.count(models.CourseName.id).label("course_count"),
-        )
-        .group_by(models.CourseName.uni_name)
-        .all()
+# Background exports: the file is built by a worker process and fetched
+# once the job is done
+@app.post("/export_jobs")
+async def create_export_job(job: schemas.ExportJobCreate, db: Session = Depends(get_db)):
+    if not export_jobs.format_supported(job.format):
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {job.format}")
+    db_job = export_jobs.enqueue(db, job.format, job.agent_id or [], job.application_id or [])
+    return {'status': 200, 'data': export_jobs.describe(db_job), 'message': 'Export queued'}
+
+
+@app.get("/export_jobs/{job_id}")
+async def get_export_job(job_id: str, db: Session = Depends(get_read_db)):
+    db_job = db.query(models.ExportJob).filter(models.ExportJob.id == job_id).first()
+    if not db_job:
+        return JSONResponse(status_code=404, content={'message': "Not Found", 'data': "Not found"})
+    return {'status': 200, 'data': export_jobs.describe(db_job), 'message': 'Success'}
+
+
+@app.get("/export_jobs/{job_id}/download")
+async def download_export_job(job_id: str, db: Session = Depends(get_read_db)):
+    db_job = db.query(models.ExportJob).filter(models.ExportJob.id == job_id).first()
+    if not db_job:
+        return JSONResponse(status_code=404, content={'message': "Not Found", 'data': "Not found"})
+    if db_job.status != "done":
+        return JSONResponse(status_code=409, content={'message': f"Export is {db_job.status}", 'data': export_jobs.describe(db_job)})
+    return FileResponse(
+        db_job.file_path,
+        media_type=export_jobs.FORMATS[db_job.format],
+        filename=f"Exported_Data.{db_job.format}",
     )
 
-    # Constructing the response
-    agents_list = [
-        {"id": i + 1, "name": uni_name, "count": course_count}
-        for i, (uni_name, course_count) in enumerate(uni_data)
-    ]
-    permit_data = (  # uni_data
-        db.query(
-            models.CourseName.study_permit,
-            func.count(models.CourseName.uni_name).label("course_count"),
-        )
-        .group_by(models.CourseName.study_permit)
-        .all()
-    )
-    permit_list = [
-        {"id": i + 1, "name": uni_name, "count": course_count}
-        for i, (uni_name, course_count) in enumerate(permit_data)
-    ]
-    uni_nm_data = (  # uni_data
-        db.query(
-            models.CourseName.course_name,
-            func.count(models.CourseName.uni_name).label("course_count"),
-        )
-        .group_by(models.CourseName.course_name)
-        .all()
+
+# Visa Granted
+@app.get("/visa/")
+async def get_visa_granted(
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None),
+    with_total: bool = Query(False),
+    db: Session = Depends(get_read_db),
+):
+    students1 = (
+        db.query(models.Application)
+        .filter(models.Application.status == "Visa Granted")
+        .order_by(desc(models.Application.id))
     )
-    course_list = [
-        {"id": i + 1, "name": uni_name, "count": course_count}
-        for i, (uni_name, course_count) in enumerate(uni_nm_data)
-    ]
-    return {
-        "status": 200,
-        "data": {
-            "uni_data": agents_list,
-            "permit_data": permit_list,
-            "course_data": course_list,
-        },
-        "message": "Success",
-    }
+    page = paginate(students1, schemas.PageParams(cursor=cursor, limit=limit, with_total=with_total),
+                    models.Application.id, descending=True)
+    return page.attach({"status": 200, "data": page.rows, "message": "Success all "})
+    
 
 
 # @app.post("/csv")
@@ -1520,109 +1178,30 @@ async def get_comm(
 ):
 
     if commission.data:
-        total_amount = 0
-        total_profit = 0
-        total_recieved = 0
-        total_pending = 0
-        # Collect all ids to query them in a single batch
-        ids = [each_data["id"] for each_data in commission.data]
-        db_rows = (
-            db.query(models.commission).filter(models.commission.id.in_(ids)).all()
-        )
-
-        # Create a dictionary to map ids to rows for quick lookup
-        db_row_dict = {row.id: row for row in db_rows}
-
-        for each_data in commission.data:
-            db_row = db_row_dict.get(each_data["id"])
-            if db_row is None:
-                continue  # Skip if the row doesn't exist
-
-            final_amount = db_row.final_amount
-            amount = db_row.pay_fee
-            currency = db_row.currency
-            current_rate = db_row.rate
-            com = db_row.gain_commission
-
-            if commission.action:
-
-                gst = each_data["gst"]
-                current_rate = each_data["rate"]
-                tds = each_data["tds"]
-                com = each_data["commission"]
-                charge = each_data["charges"]
+        try:
+            totals = commission_engine.select_commissions(db, commission.data, commission.action)
+        except commission_engine.InvalidCommissionInput:
+            data = {"message": "Incorrect input", "data": "invalid"}
+            return JSONResponse(status_code=403, content=data)
+        return {"status": 200, "data": totals, "message": "success"}
 
-                db_row.charges = charge
-                db_row.gain_commission = com
-                db_row.tds = tds
-                db_row.gst = gst
-                db_row.rate = current_rate
-
-            isPaid = db_row.pay_recieve
-            
-
-            if isPaid:
-                total_recieved += float(final_amount)
-                com = float(com)
+    else:
+        page = paginate(db.query(models.commission), commission, models.commission.id)
+        return page.attach({"status": 200, "data": page.rows, "message": "Success"})
 
-                total_profit += float((float(com / 100)) * final_amount)
-                
-                total_amount += final_amount
 
-            else:
-                # Change the currency to INR
-                if commission.action:
-                    current_rate = float(current_rate) if current_rate else 1
-                    amount = round(float(amount))
-
-                    tds = float(tds)
-                    gst = float(gst)
-                    com = float(com)
-                    charge = float(charge)
-                    if tds < 0 or gst < 0 or com < 0 or charge < 0:
-                        data = {"message": "Incorrect input", "data": "invalid"}
-                        return JSONResponse(status_code=403, content=data)
-
-                    # print(amount)
-                    com_amount = amount * (com / 100)
-                    
-                    
-                    after_charge = (
-                        (com_amount - charge) * current_rate
-                        if charge > 0
-                        else com_amount * current_rate
-                    )
-                    
-                    after_tds = (
-                        ((tds / 100) * after_charge) if tds > 0 else after_charge
-                    )
-                    
-                    
-                    after_gst = after_tds - ((gst / 100) * after_tds) if gst > 0 else 0
-                    
-                    final_amount = after_charge - after_tds - after_gst if after_tds != after_charge else after_charge - after_gst
-                    
-                    # total_profit += (com / 100) * after_charge if com > 0 else 0
-                    db_row.final_amount = round(float(final_amount), 3)
-                total_amount += final_amount
-                total_pending += final_amount
-            db.commit()  # Commit once after all updates
-            db.refresh(db_row)  # Refresh once after all updates
-
-        return {
-            "status": 200,
-            "data": {
-                "total": round(total_amount, 3),
-                "profit": round(total_profit, 3),
-                "pending": round(total_pending, 3),
-                "recieved": round(total_recieved, 3),
-            },
-            "message": "success",
-        }
-
-    else:
-        db_commissions = db.query(models.commission).all()
-        return {"status": 200, "data": db_commissions, "message": "Success"}
+@app.post("/commission_simulate")
+async def simulate_commission(
+    scenario: schemas.commission_simulate, db: Session = Depends(get_read_db)
+):
+    try:
+        data = commission_engine.simulate(
+            db, rate=scenario.rate, rates=scenario.rates, tds=scenario.tds, gst=scenario.gst
+        )
+    except commission_engine.InvalidCommissionInput:
+        data = {"message": "Incorrect input", "data": "invalid"}
+        return JSONResponse(status_code=403, content=data)
+    return {"status": 200, "data": data, "message": "success"}
 
 
 
@@ -1650,45 +1229,19 @@ async def get_comm(pay_data: schemas.change_status_fee, db: Session = Depends(ge
 
 
 @app.post("/commission_get")
-async def get_comm(commission: schemas.commission_get, db: Session = Depends(get_db)):
-    app_data = []
+async def get_comm(commission: schemas.commission_get, db: AsyncSession = Depends(get_async_read_db)):
+    db_commissions = select(models.commission)
 
     # Selected agent
     if commission.agent_ids:
-        response2 = []
-        for agent in commission.agent_ids:
-            db_commissions = (
-                db.query(models.commission)
-                .filter(models.commission.agent_id == agent)
-                .all()
-            )
-            response2.append(db_commissions)
-        response2 = [data for row in response2 for data in row]
-        return {"status": 200, "data": response2, "message": "Success"}
+        db_commissions = db_commissions.where(models.commission.agent_id.in_(commission.agent_ids))
 
     # Checking the filter
-    if commission.paid_status == 0 or commission.paid_status == 1:
-        if commission.paid_status == 1:
-            db_commissions = (
-                db.query(models.commission)
-                .filter(models.commission.pay_recieve == 1)
-                .all()
-            )
-            return {"status": 200, "data": db_commissions, "message": "Success"}
-        else:
-            db_commissions = (
-                db.query(models.commission)
-                .filter(models.commission.pay_recieve == 0)
-                .all()
-            )
-            return {"status": 200, "data": db_commissions, "message": "Success"}
-
-    # if filter is not selected
-    else:
+    elif commission.paid_status == 0 or commission.paid_status == 1:
+        db_commissions = db_commissions.where(models.commission.pay_recieve == commission.paid_status)
 
-        db_commissions = db.query(models.commission).all()
-        app_data.append(db_commissions)
-        return {"status": 200, "data": db_commissions, "message": "Success"}
+    page = await paginate_async(db, db_commissions, commission, models.commission.id)
+    return page.attach({"status": 200, "data": page.rows, "message": "Success"})
 
 
 # @app.post("/expense")
@@ -1721,10 +1274,10 @@ async def get_comm(commission: schemas.commission_get, db: Session = Depends(get
 
 @app.post("/expense")
 async def post_expense(
-    expenses: schemas.expense, request: Request, db: Session = Depends(get_db)
+    expenses: schemas.expense, role_name: str = Depends(get_role), db: Session = Depends(get_db)
 ):
-    # Fetch role name from token
-    role_name = await get_role_from_token(request)
+    if models.to_paise(expenses.cost) is None:
+        return {'status': 400, 'message': 'Invalid Cost'}
     
     # Fetch category name from database
     db_category_name = db.query(models.Category.category_name).filter(models.Category.id == expenses.category_id).first()
@@ -1765,7 +1318,7 @@ async def post_expense(
     }
 
 @app.get("/get_category")
-async def getCategory(id: Optional[int] = Query(None), db: Session = Depends(get_db)):
+async def getCategory(id: Optional[int] = Query(None), db: Session = Depends(get_read_db)):
     
     db_category = db.query(models.Category).all()
     db_sub = db.query(models.CategorySub).filter(models.CategorySub.category_id == id).all()
@@ -1773,202 +1326,16 @@ async def getCategory(id: Optional[int] = Query(None), db: Session = Depends(get
 
 
 @app.post("/get_expense")
-async def get_expense(fil: schemas.getExpenses, db: Session = Depends(get_db)):
-
-
-    # card values
-    netTotal = 0.0
-    income_ = 0.0
-    expense_ = 0.0
-    db_income = db.query(models.Expense.cost).filter(models.Expense.expendature == 1).all()
-    db_expense = db.query(models.Expense.cost).filter(models.Expense.expendature == 0).all()
-    if db_income:
-            income = [round(float(item[0]),3) for item in db_income]
-            for cost in income:
-                income_+=cost
-                netTotal+=cost
-    if db_expense:
-            expense = [round(float(item[0]),3) for item in db_expense]
-            for cost in expense:
-                netTotal-=cost
-                expense_+=cost
-
-    if fil.search or fil.category_ids or fil.sub_category_ids or fil.status==1 or fil.status ==0 :
-        
-        common_ids = []
-        status_ids = []
-        if fil.status == 0 or fil.status == 1:
-            db_query = db.query(models.Expense.id).filter(models.Expense.expendature == fil.status).all()
-            status_ids.append(db_query)
-            
-            flatten = [item for row in status_ids for item in row]
-            status_ids = [item[0] for item in flatten]
-            
-            
-        if fil.category_ids:
-            
-            ids = fil.category_ids
-            # getting ids in category
-            for id in ids:
-                db_query = db.query(models.Expense.id).filter(models.Expense.category_id == id).all()
-                common_ids.append(db_query)
-            flatten = [item for row in common_ids for item in row]
-            common_ids = [item[0] for item in flatten]
-            common_ids = list(set(common_ids))
-
-        if fil.sub_category_ids:
-            sub  = []
-            sub_ids =  fil.sub_category_ids
-            # getting ids in sub_category
-            for id in sub_ids:
-                db_query =  db.query(models.Expense.id).filter(models.Expense.sub_category_id == id).all()
-                sub.append(db_query)
-            flatten = [item for row in sub for item in row]
-            sub = [item[0] for item in flatten]
-            sub = list(set(sub))
-            
-           
-            
-            if common_ids:
-               
-                common_ids= list(set(common_ids).intersection(set(sub)))
-            else:
-                common_ids = common_ids+sub
-                
-                            
-                
+async def get_expense(fil: schemas.getExpenses, db: AsyncSession = Depends(get_async_read_db)):
+    # One WHERE clause drives both the rows and the card totals
+    conditions = ledger.expense_filters(fil)
+    cards = await ledger.totals_async(db, *conditions)
+
+    db_expenses = select(models.Expense).where(*conditions).order_by(desc(models.Expense.date))
+    page = await paginate_async(db, db_expenses, fil, models.Expense.date, models.Expense.id, descending=True)
+    return page.attach({'status': 200, 'data': dict(cards, content=page.rows), 'message': 'success'})
+
 
-        if fil.search:
-            pattern = fil.search.lower().replace(" ","")    
-            if not common_ids and not status_ids :
-                    
-                    db_search = db.query(models.Expense).filter(
-                    func.trim(models.Expense.category).ilike(f"%{pattern}%")
-                    | func.trim(models.Expense.sub_category).ilike(f"%{pattern}%")
-                    | func.trim(models.Expense.description).ilike(f"%{pattern}%")
-                ).all()
-                    return {'status':200,'data':{'total':netTotal,'income':income_,'expense':expense_,'content':db_search},'message':'Success with only search'} 
-             
-            else:
-                res = []
-                searchWithCategory = []    
-                if common_ids and status_ids:
-                    
-                    final_ids= list(set(common_ids).intersection(set(status_ids)))
-                    for id in final_ids:
-                        db_query = (
-                            db.query(models.Expense).filter(models.Expense.id == id).first()
-                        )
-                        if db_query:
-                            res.append(db_query)
-                    
-                    for row in res:
-                        desc = row.description.lower().replace(" ","")
-                        category  = row.category.lower().replace(" ","")
-                        sub = row.sub_category.lower().replace(" ","")
-                        if re.search(pattern, desc, re.IGNORECASE) or re.search(
-                                pattern, category, re.IGNORECASE
-                            ) or re.search(pattern,sub,re.IGNORECASE):
-                            searchWithCategory.append(row)
-
-                    return {'status':200,'data':{'total':netTotal,'income':income_,'expense':expense_,'content':searchWithCategory},'message':'success3'}
-                
-                if common_ids:
-                    
-                    for id in common_ids:
-                        db_query = db.query(models.Expense).filter(models.Expense.id == id).first()
-                        res.append(db_query)
-
-                    for row in res:
-                        desc = row.description.lower().replace(" ","")
-                        category  = row.category.lower().replace(" ","")
-                        sub = row.sub_category.lower().replace(" ","")
-                        if re.search(pattern, desc, re.IGNORECASE) or re.search(
-                                pattern, category, re.IGNORECASE
-                            ) or re.search(pattern,sub,re.IGNORECASE):
-                            searchWithCategory.append(row)
-
-                    return {'status':200,'data':{'total':netTotal,'income':income_,'expense':expense_,'content':searchWithCategory},'message':'success'}
-                
-                if status_ids:
-                    
-                    
-                    for id in status_ids:
-                        db_query = db.query(models.Expense).filter(models.Expense.id == id).first()
-                        res.append(db_query)
-                    for row in res:
-                        desc = row.description.lower().replace(" ","")
-                        category  = row.category.lower().replace(" ","")
-                        sub = row.sub_category.lower().replace(" ","")
-                        if re.search(pattern, desc, re.IGNORECASE) or re.search(
-                                pattern, category, re.IGNORECASE
-                            ) or re.search(pattern,sub,re.IGNORECASE):
-                            searchWithCategory.append(row)
-
-                    return {'status':200,'data':{'total':netTotal,'income':income_,'expense':expense_,'content':searchWithCategory},'message':'success'}
-
-        if common_ids or status_ids:
-            
-            res = []
-                
-            inco = 0.0        
-            exp = 0.0
-            total = 0.0
-    
-    
-            common_ids = list(set(common_ids))
-            
-            if common_ids and status_ids:
-                
-                final_ids= list(set(common_ids).intersection(set(status_ids)))
-                
-                for id in final_ids:
-                    db_query = (
-                        db.query(models.Expense).filter(models.Expense.id == id).first()
-                    )
-                    
-                    if db_query:
-                        if db_query.expendature:
-                            inco+=round(float(db_query.cost),3)
-                            total+=round(float(db_query.cost),3)
-                        else:
-                            exp+=round(float(db_query.cost),3)
-                            total-=round(float(db_query.cost),3)
-                        res.append(db_query)
-                return {'status':200,'data':{'total':total,'income':inco,'expense':exp,'content':res},'message':'success'}
-
-            if common_ids:
-                print("3")
-                for id in common_ids:
-                    
-                    db_query = (
-                        db.query(models.Expense).filter(models.Expense.id == id).first()
-                    )
-                    if db_query:
-                        res.append(db_query)
-                        if db_query.expendature:
-                            inco+=round(float(db_query.cost),3)
-                            total+=round(float(db_query.cost),3)
-                        else:
-                            exp+=round(float(db_query.cost),3)
-                            total-=round(float(db_query.cost),3)
-                return {'status':200,'data':{'total':total,'income':inco,'expense':exp,'content':res},'message':'success'}
-            
-            if status_ids:
-                
-                db_query = (
-                    db.query(models.Expense).filter(models.Expense.expendature == fil.status).all()
-                )
-                 
-                return {'status':200,'data':{'total':netTotal,'income':income_,'expense':expense_,'content':db_query},'message':'success'}
-        else:
-            return {'status':200,'data':{'total':0.0,'income':0.0,'expense':0.0,'content':[]},'message':'success'}
-                
-    else:
-        from sqlalchemy import desc
-        db_expenses = (db.query(models.Expense).order_by(desc(models.Expense.date)).all())
-        
-        return {"status": 200, "data": {'total':netTotal,'income':income_,'expense':expense_,'content':db_expenses}, "message": "success_else"}
 BASE_DIR = Path("uploaded_files")
 BASE_DIR.mkdir(exist_ok=True)
 
@@ -2055,9 +1422,6 @@ async def upload_files(
     pincode: str = Form(...),
     db: Session = Depends(get_db)
 ):
-    agency_dir = BASE_DIR / agency_name.replace(" ", "_")
-    agency_dir.mkdir(parents=True, exist_ok=True)
-
     uploaded_files = {
         "cancel_check": cancel_check,
         "pan_card": pan_card,
@@ -2066,8 +1430,6 @@ async def upload_files(
         "gst_certificate": gst_certificate
     }
 
-    file_paths = {}
-
     for file_type, file in uploaded_files.items():
         # Validate file extension
         file_extension = Path(file.filename).suffix.lower()
@@ -2077,34 +1439,26 @@ async def upload_files(
                 detail=f"Unsupported file type for {file_type.replace('_', ' ').title()}. Allowed types: PDF, JPG, JPEG, PNG."
             )
 
-        # Save file with specific name
-        new_filename = f"{file_type}{file_extension}"
-        file_path = agency_dir / new_filename
-
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        file_paths[file_type] = str(file_path)
-
-    # Save file records in a single database entry
-    file_record = models.AgencyFiles(
-        user_id=user_id,
-        agency_name=agency_name,
-        mail=mail,
-        phone=phone,
-        city=city,
-        address=address,
-        pincode=pincode,
-        cancel_check_path=file_paths["cancel_check"],
-        pan_card_path=file_paths["pan_card"],
-        company_registration_path=file_paths["company_registration"],
-        aadhar_card_path=file_paths["aadhar_card"],
-        gst_certificate_path=file_paths["gst_certificate"]
-    )
-    db.add(file_record)
+    # All five are streamed concurrently off the event loop into the
+    # content-addressed store; unchanged documents are not written again
+    checksums = await documents.store_all(db, uploaded_files)
+
+    # One record per agency user, updated in place on re-upload
+    file_record = db.query(models.AgencyFiles).filter(models.AgencyFiles.user_id == user_id).first()
+    if file_record is None:
+        file_record = models.AgencyFiles(user_id=user_id)
+        db.add(file_record)
+    file_record.agency_name = agency_name
+    file_record.mail = mail
+    file_record.phone = phone
+    file_record.city = city
+    file_record.address = address
+    file_record.pincode = pincode
+    documents.attach(db, file_record, checksums)
     db.commit()
 
-    return {"message": "Files uploaded successfully", "file_paths": file_paths}
+    file_paths = {file_type: str(documents.blob_path(sha256)) for file_type, sha256 in checksums.items()}
+    return {"message": "Files uploaded successfully", "file_paths": file_paths, "checksums": checksums}
 
 @app.get("/get-files/{user_id}")
 def get_files(user_id: int, db: Session = Depends(get_db)):
@@ -2120,5 +1474,58 @@ def get_files(user_id: int, db: Session = Depends(get_db)):
             "Company Registration": file_record.company_registration_path,
             "Aadhar Card": file_record.aadhar_card_path,
             "GST Certificate": file_record.gst_certificate_path
+        },
+        "downloads": {
+            "Cancel Check": f"/documents/{user_id}/cancel_check",
+            "Pan Card": f"/documents/{user_id}/pan_card",
+            "Company Registration": f"/documents/{user_id}/company_registration",
+            "Aadhar Card": f"/documents/{user_id}/aadhar_card",
+            "GST Certificate": f"/documents/{user_id}/gst_certificate"
         }
-    }
\ No newline at end of file
+    }
+
+
+def _document_owner(db, claims):
+    # KYC scans are only served to admins and to the agency's own login;
+    # returns None for admins, otherwise the caller's credentials id.
+    if claims.get("Role") == "Admin":
+        return None
+    owner = db.query(models.Credentials.id).filter(models.Credentials.email == claims.get("email")).first()
+    if owner is None:
+        raise HTTPException(status_code=403, detail="Not allowed to access these documents.")
+    return owner.id
+
+
+@app.get("/documents/blob/{sha256}")
+async def download_blob(sha256: str, request: Request, claims: dict = Depends(get_claims), db: Session = Depends(get_read_db)):
+    sha256 = sha256.lower()
+    owner_id = _document_owner(db, claims)
+    if owner_id is not None:
+        columns = [getattr(models.AgencyFiles, f"{document}_sha256") for document in documents.AGENCY_DOCUMENTS]
+        owned = (
+            db.query(models.AgencyFiles.id)
+            .filter(models.AgencyFiles.user_id == owner_id, or_(*[column == sha256 for column in columns]))
+            .first()
+        )
+        if owned is None:
+            raise HTTPException(status_code=404, detail="Document not found.")
+    blob = db.get(models.DocumentBlob, sha256)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    return await downloads.serve(request, blob, downloads.IMMUTABLE)
+
+
+@app.get("/documents/{user_id}/{document}")
+async def download_document(user_id: int, document: str, request: Request, claims: dict = Depends(get_claims), db: Session = Depends(get_read_db)):
+    if document not in documents.AGENCY_DOCUMENTS:
+        raise HTTPException(status_code=404, detail="Unknown document type.")
+    owner_id = _document_owner(db, claims)
+    if owner_id is not None and owner_id != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed to access these documents.")
+    file_record = db.query(models.AgencyFiles).filter(models.AgencyFiles.user_id == user_id).first()
+    sha256 = getattr(file_record, f"{document}_sha256", None)
+    blob = db.get(models.DocumentBlob, sha256) if sha256 else None
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    filename = document + (mimetypes.guess_extension(blob.content_type or "") or "")
+    return await downloads.serve(request, blob, downloads.REVALIDATE, filename)
\ No newline at end of file
@@ -1,13 +1,11 @@
-import requests
+import asyncio
+
+from app.fx import fx_rates
 
-def currency(curr):
-    url = "https://api.exchangerate-api.com/v4/latest/"
-    response = requests.get(url + f"{curr}")
-    res = response.json()
-    indian_val = res['rates'].get('INR', None)
 
-    return indian_val
+def currency(curr):
+    return asyncio.run(fx_rates.rate(curr))
 
 currency_name=str(input("Enter a Currency:"))
 amt=currency(currency_name)
-print(amt)
\ No newline at end of file
+print(amt)